@@ -1,7 +1,7 @@
 import os
 from server.agentic.agents.nodes import PRState
 from server.agentic.utils.llm_client import llm
-from server.servcies.github import post_pr_comment, update_pr_comment
+from server.servcies.github import publish_pr_review
 
 
 def aggregator_agent(state: PRState) -> dict:
@@ -20,6 +20,8 @@ def aggregator_agent(state: PRState) -> dict:
     pr_description = state.get("pr_description", "")
     pr_number = state.get("pr_number", "")
     repo_name = state.get("repo_name", "")
+    review_mode = state.get("review_mode", "full")
+    since_sha = state.get("since_sha") or ""
     
     # NEW: Get progress comment info
     progress_comment_id = state.get("progress_comment_id")
@@ -47,6 +49,7 @@ You are CodeDaddy, an expert AI code reviewer. Generate a comprehensive GitHub P
 
 PR Title: {pr_title}
 PR Description: {pr_description}
+{f"Review Scope: incremental, covering only commits pushed after {since_sha[:7]}. Findings on untouched files are carried over from the previous review." if review_mode == "incremental" else ""}
 Files Changed: {len(files_changed)} files
 File List: {', '.join(files_changed[:5])}{"..." if len(files_changed) > 5 else ""}
 
@@ -223,36 +226,13 @@ Make it look EXACTLY like a real CodeDaddy review with all the visual polish and
     print(f"Review stats: {result}")
     
     # Post or update the comment
-    if progress_comment_id:
-        # Update the existing "in progress" comment
-        try:
-            print(f"Updating progress comment {progress_comment_id} with final review")
-            update_pr_comment(
-                comment_id=progress_comment_id,
-                owner=owner,
-                repo=repo,
-                body=review_content,
-                installation_id=installation_id
-            )
-            print("✅ Progress comment updated with final review")
-        except Exception as e:
-            print(f"❌ Failed to update comment {progress_comment_id}: {e}")
-            print("Posting as new comment instead")
-            post_pr_comment(
-                pr_number=pr_number,
-                owner=owner,
-                repo=repo,
-                body=review_content,
-                installation_id=installation_id
-            )
-    else:
-        print("No progress comment found, posting new comment")
-        post_pr_comment(
-            pr_number=pr_number,
-            owner=owner,
-            repo=repo,
-            body=review_content,
-            installation_id=installation_id
-        )
+    publish_pr_review(
+        pr_number=pr_number,
+        owner=owner,
+        repo=repo,
+        body=review_content,
+        installation_id=installation_id,
+        progress_comment_id=progress_comment_id
+    )
     
     return result
\ No newline at end of file
@@ -4,6 +4,7 @@ from operator import add
 from server.agentic.utils.llm_client import llm
 from server.agentic.utils.vector_tool import search_vector_tool
 from server.agentic.utils.shrink import compress_state
+from server.agentic.utils.code_graph import call_graph_summary
 
 from server.agentic.utils.pr_state import PRState
 # -----------------------------
@@ -90,6 +91,9 @@ PR #{state['pr_number']} - {state['repo_name']}
 Diff:
 {state.get('diff_content', '')}
 
+Call graph of changed code:
+{call_graph_summary(state)}
+
 Learnings:
 {learnings}
 
@@ -154,6 +158,9 @@ PR #{state['pr_number']} - {state['repo_name']}
 Diff:
 {state.get('diff_content', '')}
 
+Call graph of changed code (callers are candidates for regression tests):
+{call_graph_summary(state)}
+
 Learnings:
 {learnings}
 
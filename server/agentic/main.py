@@ -1,11 +1,20 @@
+import io
 import os
 import json
-import tempfile
-import boto3
 from redis import Redis
 from server.agentic.utils.qdrant_db import prepare_and_store_context
 from server.agentic.agents.graph import workflow
 from server.agentic.utils.pr_state import PRState
+from server.servcies.github import publish_pr_review
+from server.utils.review_store import (
+    get_last_review, save_review, carry_over_findings, get_cached_review, release_review_claim
+)
+from server.utils.context_budget import render_selected_context
+from server.agentic.utils.code_graph import attach_code_graph, release_code_graph
+from server.utils.context_artifact import ContextArtifact
+from server.utils.artifact_store import get_artifact_store
+from server.utils.pr_jobs import drop_if_superseded
+from server.utils.queues import REVIEW_QUEUE
 from rq import Queue
 
 REDIS_URL = os.getenv("REDIS_URL")
@@ -17,38 +26,25 @@ except Exception as e:
     print("[Worker] Redis connection failed:", e)
     raise
 
-queue = Queue("pr_context_queue", connection=connection)
+queue = Queue(REVIEW_QUEUE, connection=connection)
 
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION"),
-)
+artifact_store = get_artifact_store()
 
-def download_s3_file(s3_uri):
-    """Download S3 file to a temp location and return local path."""
-    if not s3_uri.startswith("s3://"):
-        raise ValueError("Invalid S3 URI")
+# Upper bound on the plain-text context read into memory (and embedded) per job.
+CONTEXT_TXT_MAX_CHARS = int(os.getenv("CONTEXT_TXT_MAX_CHARS", str(4 * 1024 ** 2)))
 
-    _, bucket_key = s3_uri.split("s3://", 1)
-    bucket, key = bucket_key.split("/", 1)
-    tmp_file = tempfile.NamedTemporaryFile(delete=False)
-    s3_client.download_file(bucket, key, tmp_file.name)
-    return tmp_file.name
 
-def delete_s3_file(s3_uri):
-    """Delete a file from S3."""
-    if not s3_uri or not s3_uri.startswith("s3://"):
-        return
-    
-    try:
-        _, bucket_key = s3_uri.split("s3://", 1)
-        bucket, key = bucket_key.split("/", 1)
-        s3_client.delete_object(Bucket=bucket, Key=key)
-        print(f"[S3] Deleted: {s3_uri}")
-    except Exception as e:
-        print(f"[S3] Failed to delete {s3_uri}: {e}")
+def read_text_artifact(uri, max_chars=CONTEXT_TXT_MAX_CHARS):
+    """Stream a text artifact, keeping at most max_chars characters."""
+    with artifact_store.open(uri) as raw, io.TextIOWrapper(raw, encoding="utf-8", errors="replace") as f:
+        return f.read(max_chars)
+
+
+def delete_artifacts(*uris):
+    for uri in uris:
+        if uri:
+            artifact_store.delete(uri)
+
 
 def process_ai_job(job_data: dict):
     print("Received job",  job_data)
@@ -57,6 +53,8 @@ def process_ai_job(job_data: dict):
     commit_sha = job_data.get("commit_sha")
     context_json_uri = job_data.get("context_json")
     context_txt_uri = job_data.get("context_txt")
+    context_artifact_uri = job_data.get("context_artifact")
+    graph_uri = job_data.get("graph_artifact")
     
     # NEW: Extract progress comment info
     progress_comment_id = job_data.get("progress_comment_id")
@@ -64,20 +62,54 @@ def process_ai_job(job_data: dict):
     owner = job_data.get("owner")
     repo = job_data.get("repo")
 
+    if drop_if_superseded(connection, job_data, "process_ai_job"):
+        delete_artifacts(context_json_uri, context_txt_uri, context_artifact_uri, graph_uri)
+        return
+
+    cached_review = get_cached_review(connection, repo_name, pr_number, commit_sha)
+    if cached_review is not None:
+        print(f"Review for {commit_sha} already cached, re-posting")
+        publish_pr_review(pr_number, owner, repo, cached_review, installation_id, progress_comment_id)
+        delete_artifacts(context_json_uri, context_txt_uri, context_artifact_uri, graph_uri)
+        return
+
+    review_mode = job_data.get("review_mode", "full")
+    pr_files = job_data.get("pr_files", [])
+    reanalyzed_files = job_data.get("reanalyzed_files", pr_files)
+    prior_review = get_last_review(connection, repo_name, pr_number) if review_mode == "incremental" else None
+
+    if prior_review and not reanalyzed_files and prior_review.get("final_review"):
+        print("No PR files changed since last review, re-posting previous review")
+        publish_pr_review(pr_number, owner, repo, prior_review["final_review"], installation_id, progress_comment_id)
+        save_review(connection, repo_name, pr_number, commit_sha, prior_review, prior_review["final_review"],
+                    pr_files)
+        return
+
+    # Incremental runs only see the new commits; findings on untouched files
+    # are carried over so the merged review still covers the whole PR.
+    carried = carry_over_findings(prior_review, pr_files, reanalyzed_files)
+
     json_data = {}
     txt_data = ""
-    local_json_path = local_txt_path = None
+
+    # Agents load the graph on first query, so runs that never ask skip the download.
+    attach_code_graph(graph_uri, lambda: artifact_store.get_bytes(graph_uri))
 
     try:
+        # Read through a seekable stream (ranged GETs on S3): only the index and
+        # the records actually used are fetched and decoded, one at a time.
+        if context_artifact_uri:
+            with ContextArtifact(artifact_store.open(context_artifact_uri)) as artifact:
+                json_data = artifact.to_context_dict()
+                txt_data = artifact.render_text(max_chars=CONTEXT_TXT_MAX_CHARS)
+
+        # Jobs enqueued before the single-file artifact still carry JSON + TXT.
+        # Both are read in memory (size-capped), no temp files.
         if context_json_uri:
-            local_json_path = download_s3_file(context_json_uri)
-            with open(local_json_path, "r", encoding="utf-8") as f:
-                json_data = json.load(f)
+            json_data = json.loads(artifact_store.get_bytes(context_json_uri))
 
         if context_txt_uri:
-            local_txt_path = download_s3_file(context_txt_uri)
-            with open(local_txt_path, "r", encoding="utf-8") as f:
-                txt_data = f.read()
+            txt_data = read_text_artifact(context_txt_uri)
 
         prepare_and_store_context([{
             "pr_number": pr_number,
@@ -87,16 +119,20 @@ def process_ai_job(job_data: dict):
         }])
 
 
+        # Prefer the worker's ranked, budget-packed selection over the raw text dump.
+        selected = json_data.get("selected_context") if json_data else None
+        diff_content = render_selected_context(selected) if selected and selected.get("snippets") else txt_data
+
         state = PRState(
             pr_number=int(pr_number) if pr_number else 0,
             repo_name=str(repo_name) if repo_name else "",
-            diff_content=txt_data,
+            diff_content=diff_content,
             pr_description=json_data.get("description", "") if json_data else "",
             similar_prs=[],
-            security_issues=[],
-            code_quality_issues=[],
-            performance_issues=[],
-            test_suggestions=[],
+            security_issues=carried["security_issues"],
+            code_quality_issues=carried["code_quality_issues"],
+            performance_issues=carried["performance_issues"],
+            test_suggestions=carried["test_suggestions"],
             learnings="",
             final_review="",
             commit_sha=commit_sha,
@@ -104,16 +140,31 @@ def process_ai_job(job_data: dict):
             progress_comment_id=progress_comment_id,
             installation_id=installation_id,
             owner=owner,
-            repo=repo
+            repo=repo,
+            review_mode=review_mode,
+            since_sha=job_data.get("since_sha"),
+            files_changed=reanalyzed_files,
+            graph_artifact=graph_uri
         )
 
         print(f"Starting workflow with progress_comment_id: {progress_comment_id}")
-        workflow.invoke(state)
+        # Stream node by node so a newer push can stop the review between agents
+        # (before the aggregator publishes anything).
+        final_state = state
+        for final_state in workflow.stream(state, stream_mode="values"):
+            if not final_state.get("review_complete") and drop_if_superseded(
+                    connection, job_data, "the next review agent"):
+                return
         print("Workflow completed successfully")
 
+        save_review(connection, repo_name, pr_number, commit_sha, final_state, final_state.get("final_review"),
+                    pr_files)
+
     except Exception as e:
         print(f"Error in process_ai_job: {e}")
+        # No retry for this stage: free the head so a redelivery can review it.
+        release_review_claim(connection, repo_name, pr_number, commit_sha)
         raise
     finally:
-        delete_s3_file(context_json_uri)
-        delete_s3_file(context_txt_uri)
\ No newline at end of file
+        delete_artifacts(context_json_uri, context_txt_uri, context_artifact_uri, graph_uri)
+        release_code_graph(graph_uri)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import signal
+import socket
+import threading
+
+from redis import Redis
+from rq import Queue, SimpleWorker
+from rq.timeouts import TimerDeathPenalty
+
+from server.utils.queues import REVIEW_QUEUE
+import server.agentic.main  # noqa: F401  (job module: loaded once, before the threads start)
+
+# Reviews run concurrently per process. They spend nearly all their time
+# waiting on the LLM, GitHub and Qdrant, so threads are enough; the CPU-bound
+# process_pr stage keeps forking `rq worker` processes on its own queue.
+REVIEW_WORKER_CONCURRENCY = int(os.getenv("REVIEW_WORKER_CONCURRENCY", "8"))
+
+# Idle threads block on the queue for at most this long between shutdown checks.
+REVIEW_WORKER_POLL_SECONDS = int(os.getenv("REVIEW_WORKER_POLL_SECONDS", "2"))
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class ThreadedWorker(SimpleWorker):
+    """
+    SimpleWorker (jobs run in-process, no fork) that works off the main
+    thread: job timeouts use a timer instead of SIGALRM and signals are left
+    to the process, which sets the shared shutdown event.
+    """
+
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, *args, shutdown=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shutdown = shutdown or threading.Event()
+
+    def _install_signal_handlers(self):
+        pass
+
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        # Short blocking polls instead of one long BLPOP, so an idle thread
+        # stops within a poll of shutdown and never takes a job queued after it.
+        if timeout is None:
+            return super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+        while not self.shutdown.is_set():
+            result = super().dequeue_job_and_maintain_ttl(
+                REVIEW_WORKER_POLL_SECONDS, max_idle_time=REVIEW_WORKER_POLL_SECONDS
+            )
+            if result is None:
+                continue
+            if self.shutdown.is_set():
+                # Dequeued after the signal: leave it to the next worker.
+                job, queue = result
+                queue.push_job_id(job.id, at_front=True)
+                return None
+            return result
+        return None
+
+
+def main(concurrency=REVIEW_WORKER_CONCURRENCY):
+    shutdown = threading.Event()
+    # Jobs use the Redis connection of their own module; each worker thread
+    # gets one for its queue and heartbeats.
+    workers = []
+    for index in range(concurrency):
+        connection = Redis.from_url(REDIS_URL)
+        workers.append(ThreadedWorker(
+            [Queue(REVIEW_QUEUE, connection=connection)],
+            connection=connection,
+            name=f"review-{socket.gethostname()}-{os.getpid()}-{index}",
+            shutdown=shutdown,
+        ))
+
+    def stop(signum, frame):
+        if shutdown.is_set():
+            return
+        print(f"[ReviewWorker] Signal {signum}: finishing running reviews")
+        shutdown.set()
+        # Busy workers stop after their current job, idle ones at their next poll.
+        for worker in workers:
+            worker._stop_requested = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    threads = [threading.Thread(target=worker.work, daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    print(f"[ReviewWorker] {concurrency} threads on queue '{REVIEW_QUEUE}'")
+
+    # Short joins keep the main thread responsive to signals.
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+    print("[ReviewWorker] All threads stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+from server.utils.graph_artifact import LazyGraphArtifact
+
+# Graph artifacts of the jobs running in this process, by artifact URI.
+# Nothing is downloaded until an agent asks for the graph.
+_graphs = {}
+
+
+def attach_code_graph(uri, fetch):
+    """Register the artifact at uri; fetch() returns its bytes on first use."""
+    if uri:
+        _graphs[uri] = LazyGraphArtifact(fetch)
+
+
+def release_code_graph(uri):
+    _graphs.pop(uri, None)
+
+
+def get_code_graph(state):
+    """The job's code graph (GraphArtifact interface), or None if the worker sent none."""
+    return _graphs.get(state.get("graph_artifact"))
+
+
+def call_graph_summary(state, max_symbols=10, max_neighbours=5):
+    """Callers and callees of the definitions the PR touched, as prompt text."""
+    graph = get_code_graph(state)
+    if graph is None:
+        return ""
+    try:
+        touched = graph.touched()
+    except Exception as e:
+        print(f"[CodeGraph] Failed to load graph artifact: {e}")
+        return ""
+
+    def describe(label):
+        node = graph.node(label) or {}
+        if node.get("path") and node.get("start_line"):
+            return f"{node['name']} ({node['path']}:{node['start_line']})"
+        return node.get("name") or label
+
+    lines = []
+    for label in touched[:max_symbols]:
+        callers = sorted(graph.callers(label), key=lambda item: -item[1])[:max_neighbours]
+        # Unresolved call_target nodes are left out; they only name the callee text.
+        callees = [item for item in graph.callees(label) if (graph.node(item[0]) or {}).get("type") != "call_target"]
+        callees = sorted(callees, key=lambda item: -item[1])[:max_neighbours]
+        lines.append(f"- {describe(label)}")
+        if callers:
+            lines.append("    called by: " + ", ".join(describe(caller) for caller, _ in callers))
+        if callees:
+            lines.append("    calls: " + ", ".join(describe(callee) for callee, _ in callees))
+    return "\n".join(lines)
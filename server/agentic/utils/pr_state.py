@@ -17,3 +17,7 @@ class PRState(TypedDict):
     progress_comment_id: Optional[int]
     final_review: str
     review_complete: bool
+    review_mode: str
+    since_sha: Optional[str]
+    files_changed: List[str]
+    graph_artifact: Optional[str]
@@ -1,5 +1,6 @@
 
 from server.agentic.utils.pr_state import PRState
+from server.utils.context_budget import CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN
 
 def shrink_text(text: str, max_chars: int = 4000) -> str:
     if not text:
@@ -29,7 +30,7 @@ def compress_state(state: PRState) -> PRState:
     new_state = dict(state)
 
     # Compress large fields
-    new_state["diff_content"] = shrink_text(state.get("diff_content", ""), 5000)
+    new_state["diff_content"] = shrink_text(state.get("diff_content", ""), CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN)
     new_state["pr_description"] = shrink_text(state.get("pr_description", ""), 2000)
 
     # Compress similar PRs context
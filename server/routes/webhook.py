@@ -6,8 +6,11 @@ from server.worker.main import process_pr
 from dotenv import load_dotenv
 from fastapi import APIRouter, Request, HTTPException
 from redis import Redis
-from rq import Queue, Retry 
-from server.servcies.github import post_pr_comment
+from rq import Retry
+from server.servcies.github import post_pr_comment, publish_pr_review
+from server.utils.review_store import get_cached_review, claim_review, release_review_claim
+from server.utils.pr_jobs import record_pr_head, replace_queued_job, discard_progress_comment
+from server.utils.scheduler import submit
 
 load_dotenv()
 
@@ -26,8 +29,6 @@ except Exception as e:
     print("Redis connection failed:", e)
     raise
 
-queue = Queue("github_prs", connection=connection)
-
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "hemanth")
 
 
@@ -105,25 +106,64 @@ async def webhook(request: Request):
             pr_number = payload.get("number")
             repo_name = repo.get("full_name")
             owner, repo_name_only = repo_name.split("/")
+            commit_sha = pr.get("head", {}).get("sha")
+
+            # Newest head wins: older queued jobs for this PR are cancelled and
+            # running ones stop at their next stage boundary. Deliveries for a
+            # head that was already replaced are dropped.
+            if not record_pr_head(connection, repo_name, pr_number, commit_sha, pr.get("updated_at")):
+                print(f"{repo_name}#{pr_number} at {commit_sha} is no longer the head, ignoring")
+                return {"status": "superseded", "pr_number": pr_number, "commit_sha": commit_sha}
+
+            # Redeliveries, reopens and retries of a head we already handled:
+            # re-post the cached review on reopen, otherwise do nothing.
+            cached_review = get_cached_review(connection, repo_name, pr_number, commit_sha)
+            if cached_review is not None:
+                if action == "reopened":
+                    publish_pr_review(pr_number, owner, repo_name_only, cached_review, installation_id)
+                    return {"status": "reposted", "pr_number": pr_number, "commit_sha": commit_sha}
+                return {"status": "duplicate", "pr_number": pr_number, "commit_sha": commit_sha}
+            if not claim_review(connection, repo_name, pr_number, commit_sha):
+                print(f"Review of {repo_name}#{pr_number} at {commit_sha} already in progress, ignoring")
+                return {"status": "duplicate", "pr_number": pr_number, "commit_sha": commit_sha}
             
-            comment_id = post_progress_comment(pr_number, owner, repo_name_only, installation_id)
-            
-            pr_data = {
-                "pr_number": pr_number,
-                "base_branch": pr.get("base", {}).get("ref"),
-                "head_branch": pr.get("head", {}).get("ref"),
-                "clone_url": repo.get("clone_url"),
-                "repo_name": repo_name,
-                "action": action,
-                "commit_sha": pr.get("head", {}).get("sha"),
-                "progress_comment_id": comment_id, 
-                "installation_id": installation_id,
-                "owner": owner,
-                "repo": repo_name_only
-            }
-
-            print("Enqueuing PR:", pr_data)
-            queue.enqueue(process_pr, pr_data, retry=Retry(max=3, interval=[10, 30, 60])) 
+            # From here on the claim is ours: give it back (and drop the
+            # progress comment) if the job never makes it into the scheduler.
+            comment_id = None
+            try:
+                comment_id = post_progress_comment(pr_number, owner, repo_name_only, installation_id)
+
+                pr_data = {
+                    "pr_number": pr_number,
+                    "base_branch": pr.get("base", {}).get("ref"),
+                    "head_branch": pr.get("head", {}).get("ref"),
+                    "clone_url": repo.get("clone_url"),
+                    "repo_name": repo_name,
+                    "action": action,
+                    "commit_sha": commit_sha,
+                    "progress_comment_id": comment_id,
+                    "installation_id": installation_id,
+                    "owner": owner,
+                    "repo": repo_name_only,
+                    # Picks the scheduler lane (small-PR fast lane) and fair-share cost.
+                    "size": {
+                        "changed_files": pr.get("changed_files", 0),
+                        "additions": pr.get("additions", 0),
+                        "deletions": pr.get("deletions", 0),
+                    },
+                }
+
+                # Fair per-installation scheduling in front of the PR queues.
+                print("Submitting PR:", pr_data)
+                job = submit(connection, process_pr, pr_data, retry=Retry(max=3, interval=[10, 30, 60]))
+            except Exception as e:
+                print(f"Failed to submit {repo_name}#{pr_number} at {commit_sha}: {e}")
+                release_review_claim(connection, repo_name, pr_number, commit_sha)
+                discard_progress_comment({"progress_comment_id": comment_id, "owner": owner,
+                                          "repo": repo_name_only, "installation_id": installation_id})
+                raise
+
+            replace_queued_job(connection, repo_name, pr_number, job.id)
 
             return {"status": "queued", "pr": pr_data, "progress_comment_id": comment_id}
 
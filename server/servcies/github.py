@@ -159,4 +159,22 @@ def delete_pr_comment(comment_id: int, owner: str, repo: str, installation_id: i
         raise HTTPException(status_code=res.status_code, detail=res.text)
     
     print(f"Comment {comment_id} deleted successfully")
-    return True
\ No newline at end of file
+    return True
+
+
+def publish_pr_review(pr_number: int, owner: str, repo: str, body: str, installation_id: int, progress_comment_id: int = None):
+    """
+    Replace the 'review in progress' comment with the review body,
+    or post a new comment if there is no progress comment (or updating it fails).
+    """
+    if progress_comment_id:
+        try:
+            print(f"Updating progress comment {progress_comment_id} with final review")
+            return update_pr_comment(progress_comment_id, owner, repo, body, installation_id)
+        except Exception as e:
+            print(f"❌ Failed to update comment {progress_comment_id}: {e}")
+            print("Posting as new comment instead")
+    else:
+        print("No progress comment found, posting new comment")
+
+    return post_pr_comment(pr_number, owner, repo, body, installation_id)
@@ -0,0 +1,250 @@
+import io
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+import boto3
+
+# Where stage-to-stage artifacts (context, graph) live:
+#   "s3"      S3 only
+#   "local"   a directory shared by the stages (same host / shared volume), no network
+#   "tiered"  written to both; readers use the local copy and fall back to S3
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "s3").lower()
+ARTIFACT_LOCAL_DIR = os.getenv(
+    "ARTIFACT_LOCAL_DIR", os.path.join(tempfile.gettempdir(), "codedaddy_artifacts")
+)
+# Local artifacts older than this are swept (jobs that never consumed theirs).
+ARTIFACT_LOCAL_TTL_SECONDS = int(os.getenv("ARTIFACT_LOCAL_TTL_SECONDS", str(24 * 3600)))
+ARTIFACT_S3_PREFIX = os.getenv("ARTIFACT_S3_PREFIX", "pr_contexts")
+# Cap for whole-object reads (get_bytes); larger artifacts must be read via open().
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(256 * 1024 ** 2)))
+# Size of each ranged GET when an S3 artifact is read through open().
+ARTIFACT_READ_CHUNK = int(os.getenv("ARTIFACT_READ_CHUNK", str(1024 ** 2)))
+
+# Content-addressed URIs: cas://<sha256>[-<scope>]<ext>. Any tier holding the
+# name can serve it. The optional scope (a digest of the producing job's
+# identity) keeps jobs with byte-identical output from sharing, and then
+# deleting, each other's artifact.
+CAS_SCHEME = "cas://"
+
+
+def _digest_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cas_uri(path, scope=None):
+    suffix = f"-{hashlib.sha256(scope.encode('utf-8')).hexdigest()[:16]}" if scope else ""
+    return f"{CAS_SCHEME}{_digest_file(path)}{suffix}{os.path.splitext(path)[1]}"
+
+
+def _cas_name(uri):
+    name = uri[len(CAS_SCHEME):]
+    if "/" in name or not name:
+        raise ValueError(f"Invalid artifact URI: {uri}")
+    return name
+
+
+def _check_size(uri, size, max_bytes):
+    if size > max_bytes:
+        raise ValueError(f"Artifact {uri} exceeds the {max_bytes} byte limit")
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object; every read is a ranged GET."""
+
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        if self.pos >= self.size:
+            return 0
+        end = min(self.pos + len(buffer), self.size) - 1
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self.pos}-{end}")["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+class LocalArtifactStore:
+    """
+    Directory-backed store, laid out as <root>/<2 hex>/<sha256><ext>. Works on
+    any filesystem both stages can see; also a drop-in stand-in for S3 in tests.
+    """
+
+    def __init__(self, root=ARTIFACT_LOCAL_DIR, ttl_seconds=ARTIFACT_LOCAL_TTL_SECONDS):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+
+    def _path(self, uri):
+        name = _cas_name(uri)
+        return os.path.join(self.root, name[:2], name)
+
+    def put_file(self, file_path, uri=None, scope=None):
+        uri = uri or _cas_uri(file_path, scope)
+        target = self._path(uri)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+            os.close(fd)
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, target)
+        return uri
+
+    def exists(self, uri):
+        return uri.startswith(CAS_SCHEME) and os.path.exists(self._path(uri))
+
+    def open(self, uri):
+        """Seekable binary file object; the caller closes it."""
+        return open(self._path(uri), "rb")
+
+    def get_bytes(self, uri, max_bytes=ARTIFACT_MAX_BYTES):
+        path = self._path(uri)
+        _check_size(uri, os.path.getsize(path), max_bytes)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def delete(self, uri):
+        if not uri.startswith(CAS_SCHEME):
+            return
+        try:
+            os.remove(self._path(uri))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove artifacts older than ttl_seconds."""
+        cutoff = time.time() - self.ttl_seconds
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+
+class S3ArtifactStore:
+    """S3 bucket, same content-addressed names under ARTIFACT_S3_PREFIX. Also reads legacy s3:// URIs."""
+
+    def __init__(self, bucket=None, prefix=ARTIFACT_S3_PREFIX, client=None):
+        self.bucket = bucket or os.getenv("S3_BUCKET")
+        if not self.bucket:
+            raise ValueError("S3_BUCKET not set in environment variables")
+        self.prefix = prefix
+        self.client = client or boto3.client(
+            "s3",
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            region_name=os.getenv("AWS_REGION"),
+        )
+
+    def _location(self, uri):
+        if uri.startswith("s3://"):
+            bucket, key = uri[len("s3://"):].split("/", 1)
+            return bucket, key
+        name = _cas_name(uri)
+        return self.bucket, f"{self.prefix}/{name[:2]}/{name}"
+
+    def put_file(self, file_path, uri=None, scope=None):
+        uri = uri or _cas_uri(file_path, scope)
+        bucket, key = self._location(uri)
+        self.client.upload_file(file_path, bucket, key)
+        return uri
+
+    def open(self, uri):
+        """Seekable, buffered reader that fetches the object in ranged chunks; the caller closes it."""
+        bucket, key = self._location(uri)
+        return io.BufferedReader(S3RangeReader(self.client, bucket, key), buffer_size=ARTIFACT_READ_CHUNK)
+
+    def get_bytes(self, uri, max_bytes=ARTIFACT_MAX_BYTES):
+        bucket, key = self._location(uri)
+        body = self.client.get_object(Bucket=bucket, Key=key)["Body"]
+        try:
+            data = body.read(max_bytes + 1)
+        finally:
+            body.close()
+        _check_size(uri, len(data), max_bytes)
+        return data
+
+    def delete(self, uri):
+        bucket, key = self._location(uri)
+        try:
+            self.client.delete_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            print(f"[ArtifactStore] Failed to delete {uri}: {e}")
+
+    def evict(self):
+        pass
+
+
+class TieredArtifactStore:
+    """Local store first, S3 as the fallback tier for stages on other hosts."""
+
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+
+    def put_file(self, file_path, uri=None, scope=None):
+        uri = self.local.put_file(file_path, uri, scope)
+        return self.remote.put_file(file_path, uri)
+
+    def open(self, uri):
+        if self.local.exists(uri):
+            return self.local.open(uri)
+        return self.remote.open(uri)
+
+    def get_bytes(self, uri, max_bytes=ARTIFACT_MAX_BYTES):
+        if self.local.exists(uri):
+            return self.local.get_bytes(uri, max_bytes)
+        return self.remote.get_bytes(uri, max_bytes)
+
+    def delete(self, uri):
+        if uri.startswith(CAS_SCHEME):
+            self.local.delete(uri)
+        self.remote.delete(uri)
+
+    def evict(self):
+        self.local.evict()
+
+
+def get_artifact_store(kind=ARTIFACT_STORE):
+    """Store configured by ARTIFACT_STORE."""
+    if kind == "local":
+        return LocalArtifactStore()
+    if kind == "tiered":
+        return TieredArtifactStore(LocalArtifactStore(), S3ArtifactStore())
+    if kind == "s3":
+        return S3ArtifactStore()
+    raise ValueError(f"Unknown ARTIFACT_STORE: {kind}")
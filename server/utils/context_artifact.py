@@ -0,0 +1,172 @@
+import io
+import os
+import json
+import struct
+
+import zstandard
+
+# Single-file PR context artifact, replacing the separate JSON and TXT files.
+#
+#   MAGIC
+#   record*   u32 length + one zstd frame holding a JSON record
+#   index     u32 length + zstd frame: [[kind, key, offset, length], ...]
+#   footer    u64 index offset, MAGIC
+#
+# Records are written one at a time as the worker produces them and every
+# record is its own frame, so readers decompress only what they look at.
+# Kinds: "header" (pr_metadata, summary), "file" (per-file context without the
+# diff), "diff" (each patch, stored once), "selected_context" (diff snippets
+# reference the diff records), "source" (full file / touched symbols text).
+MAGIC = b"CDCTX01\n"
+CONTEXT_ARTIFACT_ZSTD_LEVEL = int(os.getenv("CONTEXT_ARTIFACT_ZSTD_LEVEL", "6"))
+
+_LENGTH = struct.Struct("<I")
+_FOOTER = struct.Struct("<Q8s")
+
+
+class ContextArtifactWriter:
+    """Streams records into the artifact; use as a context manager."""
+
+    def __init__(self, path, level=CONTEXT_ARTIFACT_ZSTD_LEVEL):
+        self.path = path
+        self._file = open(path, "wb")
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._index = []
+        self._file.write(MAGIC)
+
+    def _write_frame(self, payload):
+        frame = self._compressor.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        offset = self._file.tell()
+        self._file.write(_LENGTH.pack(len(frame)))
+        self._file.write(frame)
+        return offset, _LENGTH.size + len(frame)
+
+    def write(self, kind, key, payload):
+        offset, length = self._write_frame(payload)
+        self._index.append([kind, key, offset, length])
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset, _ = self._write_frame(self._index)
+        self._file.write(_FOOTER.pack(index_offset, MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ContextArtifact:
+    """
+    Lazy reader over a seekable binary file object (or bytes), e.g. a local
+    file or a ranged S3 reader. Only the footer and index are read up front;
+    each record is read and JSON-decoded on its own when accessed, so memory
+    follows the records in use rather than the artifact size.
+    """
+
+    def __init__(self, source):
+        self._file = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        self._decompressor = zstandard.ZstdDecompressor()
+
+        self._file.seek(0)
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a context artifact")
+        self._file.seek(-_FOOTER.size, io.SEEK_END)
+        index_offset, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError("Truncated context artifact")
+
+        self._index = {}
+        self._order = []
+        for kind, key, offset, length in self._read_frame(index_offset):
+            self._index[(kind, key)] = offset
+            self._order.append((kind, key))
+
+    @classmethod
+    def open(cls, path):
+        return cls(open(path, "rb"))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _read_frame(self, offset):
+        self._file.seek(offset)
+        (length,) = _LENGTH.unpack(self._file.read(_LENGTH.size))
+        return json.loads(self._decompressor.decompress(self._file.read(length)))
+
+    def get(self, kind, key=None, default=None):
+        offset = self._index.get((kind, key))
+        return default if offset is None else self._read_frame(offset)
+
+    def keys(self, kind):
+        return [key for record_kind, key in self._order if record_kind == kind]
+
+    def records(self, kind):
+        """(key, payload) for every record of one kind, in write order."""
+        for key in self.keys(kind):
+            yield key, self.get(kind, key)
+
+    @property
+    def header(self):
+        return self.get("header", default={})
+
+    def diff(self, path):
+        record = self.get("diff", path)
+        return record["patch"] if record else ""
+
+    def to_context_dict(self):
+        """The llm_context dict the worker built (diffs re-attached per file)."""
+        header = self.header
+        context = {"summary": header.get("summary", {}), "files": {}, "pr_metadata": header.get("pr_metadata", {})}
+        for path, file_context in self.records("file"):
+            context["files"][path] = {**file_context, "diff": self.diff(path)}
+        selected = self.selected_context()
+        if selected is not None:
+            context["selected_context"] = selected
+        return context
+
+    def selected_context(self):
+        selected = self.get("selected_context")
+        if selected is None:
+            return None
+        for snippet in selected.get("snippets", []):
+            if snippet["kind"] == "diff" and "code" not in snippet:
+                snippet["code"] = self.diff(snippet["path"])
+        return selected
+
+    def render_text(self, max_chars=None):
+        """
+        Plain-text view (diffs, then changed + imported sources) in the old TXT
+        layout. With max_chars, records stop being read once the text is that long.
+        """
+        metadata = self.header.get("pr_metadata", {})
+        out = [
+            f"PR #{metadata.get('pr_number')} - Repo: {metadata.get('repo_name', '')}\n",
+            f"Base branch: {metadata.get('base_branch')}, Head branch: {metadata.get('head_branch')}\n\n",
+            "=== GIT DIFFS ===\n",
+        ]
+        size = sum(len(part) for part in out)
+
+        def sections():
+            for path, record in self.records("diff"):
+                yield f"\n--- {path} ---\n" + record["patch"]
+            yield "\n=== FULL FILES (Changed + Imported) ===\n"
+            for path, record in self.records("source"):
+                yield f"\n--- {record.get('title') or path} ---\n" + record["text"]
+
+        for section in sections():
+            if max_chars is not None and size + len(section) > max_chars:
+                out.append(section[:max_chars - size] + "\n...[truncated]...")
+                break
+            out.append(section)
+            size += len(section)
+        return "".join(out)
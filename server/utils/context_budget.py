@@ -0,0 +1,62 @@
+import os
+
+# Token budget for the code context the review agents see, shared by the
+# worker (which packs ranked snippets into it) and the agents (which trim to it).
+# The default matches the agents' previous fixed 5000-character prompt limit.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1250"))
+# Token budget for the whole written PR context (diffs + sources) that is
+# stored, embedded and shown to the agents; 0 disables the limit.
+CONTEXT_TEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TEXT_TOKEN_BUDGET", "32000"))
+# Rough characters-per-token ratio for source code; no tokenizer dependency.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def render_snippet(snippet):
+    """One selected snippet as it appears in the prompt: a header line, then the code."""
+    if snippet["kind"] == "diff":
+        header = f"--- diff: {snippet['path']} ---"
+    else:
+        header = (
+            f"--- {snippet['path']}:{snippet['start_line']}-{snippet['end_line']} "
+            f"{snippet['qualified_name']} ---"
+        )
+    return f"{header}\n{snippet['code']}"
+
+
+def rendered_tokens(snippet):
+    """Tokens a snippet costs in render_selected_context(), header and separator included."""
+    return estimate_tokens(render_snippet(snippet) + "\n")
+
+
+def render_selected_context(selected):
+    """Plain-text prompt block for the snippets chosen by the worker's context selection."""
+    return "\n".join(render_snippet(snippet) for snippet in selected.get("snippets", []))
+
+
+class TextBudget:
+    """Character allowance consumed while a context is written in priority order."""
+
+    def __init__(self, max_tokens=CONTEXT_TEXT_TOKEN_BUDGET):
+        self.remaining = max_tokens * CHARS_PER_TOKEN if max_tokens else None
+
+    @property
+    def limited(self):
+        return self.remaining is not None
+
+    def fits(self, text):
+        return self.remaining is None or len(text) <= self.remaining
+
+    def take(self, text):
+        """text, cut to what is left (None once nothing is), charged to the budget."""
+        if self.remaining is None:
+            return text
+        if self.remaining <= 0:
+            return None
+        if len(text) > self.remaining:
+            text = text[:self.remaining] + "\n...[truncated: context budget reached]...\n"
+        self.remaining -= len(text)
+        return text
@@ -0,0 +1,215 @@
+import sys
+import zlib
+import struct
+from array import array
+from collections import defaultdict
+
+# Binary code-graph artifact shipped from the worker to the AI stage.
+#
+#   header   MAGIC, version, string count, node count, edge-type count
+#   sections each a little-endian u32 length followed by a zlib-compressed body:
+#     strings  NUL-separated UTF-8 string table
+#     nodes    u32 arrays (label, type, path, name, start_line, end_line, flags),
+#              string fields as string-table ids (NO_STRING when absent)
+#     per edge type: u32 type string id, then CSR u32 indptr / u32 indices / f32 weights
+#
+# Uses only the standard library (array + zlib): the CSR arrays are raw
+# buffers either way, so msgpack or Arrow would add a dependency for no gain.
+MAGIC = b"CDGRAPH\0"
+GRAPH_ARTIFACT_VERSION = 1
+NO_STRING = 0xFFFFFFFF
+FLAG_TOUCHED = 1
+
+_HEADER = struct.Struct("<8sIIII")
+_NODE_FIELDS = ("label", "type", "path", "name", "start_line", "end_line", "flags")
+
+
+def _u32(values=()):
+    return array("I", values)
+
+
+def _to_bytes(arr):
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(arr, payload):
+    arr.frombytes(payload)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def _section(payload):
+    body = zlib.compress(payload)
+    return struct.pack("<I", len(body)) + body
+
+
+def encode_graph(nodes, edges_by_type, node_paths=None, touched=()):
+    """
+    Serialize a graph: nodes is {label: attrs}, edges_by_type is
+    {edge_type: iterable of (src, dst, attrs)}, node_paths is {label: path}.
+    Labels in `touched` get FLAG_TOUCHED (the definitions the diff changed).
+    """
+    strings = {}
+
+    def sid(value):
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    node_paths = node_paths or {}
+    touched = set(touched)
+    labels = sorted(nodes)
+    ids = {label: i for i, label in enumerate(labels)}
+    columns = {name: _u32() for name in _NODE_FIELDS}
+    for label in labels:
+        attrs = nodes[label]
+        span = attrs.get("span")
+        columns["label"].append(sid(label))
+        columns["type"].append(sid(attrs.get("type")))
+        columns["path"].append(sid(node_paths.get(label)))
+        columns["name"].append(sid(attrs.get("qualified_name") or attrs.get("name")))
+        columns["start_line"].append(span[0][0] + 1 if span else 0)
+        columns["end_line"].append(span[1][0] + 1 if span else 0)
+        columns["flags"].append(FLAG_TOUCHED if label in touched else 0)
+
+    edge_sections = []
+    for edge_type, edges in edges_by_type.items():
+        rows = defaultdict(list)
+        for src, dst, attrs in edges:
+            rows[ids[src]].append((ids[dst], float(attrs.get("weight", 1))))
+        indptr, indices, weights = _u32([0]), _u32(), array("f")
+        for node_id in range(len(labels)):
+            for dst, weight in sorted(rows.get(node_id, ())):
+                indices.append(dst)
+                weights.append(weight)
+            indptr.append(len(indices))
+        edge_sections.append(
+            struct.pack("<I", sid(edge_type))
+            + _section(_to_bytes(indptr)) + _section(_to_bytes(indices)) + _section(_to_bytes(weights))
+        )
+
+    string_table = "\0".join(strings).encode("utf-8")
+    out = [_HEADER.pack(MAGIC, GRAPH_ARTIFACT_VERSION, len(strings), len(labels), len(edge_sections)),
+           _section(string_table)]
+    out.extend(_section(_to_bytes(columns[name])) for name in _NODE_FIELDS)
+    out.extend(edge_sections)
+    return b"".join(out)
+
+
+class GraphArtifact:
+    """Read side of encode_graph(): node attributes plus per-type CSR adjacency."""
+
+    def __init__(self, data):
+        magic, version, n_strings, n_nodes, n_types = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != GRAPH_ARTIFACT_VERSION:
+            raise ValueError("Unsupported graph artifact")
+        self._data = data
+        self._pos = _HEADER.size
+
+        table = self._read_section().decode("utf-8")
+        self.strings = table.split("\0") if n_strings else []
+        self.columns = {}
+        for name in _NODE_FIELDS:
+            self.columns[name] = _from_bytes(_u32(), self._read_section())
+
+        self.csr = {}
+        for _ in range(n_types):
+            (type_sid,) = struct.unpack_from("<I", data, self._pos)
+            self._pos += 4
+            indptr, indices, weights = _u32(), _u32(), array("f")
+            for arr in (indptr, indices, weights):
+                _from_bytes(arr, self._read_section())
+            self.csr[self.strings[type_sid]] = (indptr, indices, weights)
+
+        self.ids = {self.strings[sid]: i for i, sid in enumerate(self.columns["label"])}
+        self._reverse = {}
+        self._data = None
+        if len(self.ids) != n_nodes:
+            raise ValueError("Corrupt graph artifact")
+
+    def _read_section(self):
+        (length,) = struct.unpack_from("<I", self._data, self._pos)
+        self._pos += 4
+        body = self._data[self._pos:self._pos + length]
+        self._pos += length
+        return zlib.decompress(body)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _string(self, column, node_id):
+        value = self.columns[column][node_id]
+        return None if value == NO_STRING else self.strings[value]
+
+    def node(self, label):
+        """Attributes of a node as a dict, or None."""
+        node_id = self.ids.get(label)
+        if node_id is None:
+            return None
+        return {
+            "label": label,
+            "type": self._string("type", node_id),
+            "path": self._string("path", node_id),
+            "name": self._string("name", node_id),
+            "start_line": self.columns["start_line"][node_id],
+            "end_line": self.columns["end_line"][node_id],
+            "touched": bool(self.columns["flags"][node_id] & FLAG_TOUCHED),
+        }
+
+    def touched(self):
+        labels = self.columns["label"]
+        return [self.strings[labels[i]] for i, flags in enumerate(self.columns["flags"]) if flags & FLAG_TOUCHED]
+
+    def successors(self, label, edge_type):
+        """[(label, weight)] of outgoing edges of one type."""
+        node_id = self.ids.get(label)
+        if node_id is None or edge_type not in self.csr:
+            return []
+        indptr, indices, weights = self.csr[edge_type]
+        labels = self.columns["label"]
+        return [(self.strings[labels[indices[k]]], weights[k]) for k in range(indptr[node_id], indptr[node_id + 1])]
+
+    def predecessors(self, label, edge_type):
+        """[(label, weight)] of incoming edges of one type (reverse CSR built on first use)."""
+        node_id = self.ids.get(label)
+        if node_id is None or edge_type not in self.csr:
+            return []
+        if edge_type not in self._reverse:
+            indptr, indices, weights = self.csr[edge_type]
+            incoming = defaultdict(list)
+            for src in range(len(indptr) - 1):
+                for k in range(indptr[src], indptr[src + 1]):
+                    incoming[indices[k]].append((src, weights[k]))
+            self._reverse[edge_type] = incoming
+        labels = self.columns["label"]
+        return [(self.strings[labels[src]], weight) for src, weight in self._reverse[edge_type].get(node_id, ())]
+
+    def callers(self, label):
+        return self.predecessors(label, "calls")
+
+    def callees(self, label):
+        return self.successors(label, "calls")
+
+
+class LazyGraphArtifact:
+    """Defers fetching and decoding the artifact until the first query."""
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._graph = None
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = GraphArtifact(self._fetch())
+        return self._graph
+
+    def __getattr__(self, name):
+        return getattr(self.graph, name)
@@ -0,0 +1,139 @@
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+
+from server.servcies.github import delete_pr_comment
+from server.utils.review_store import release_review_claim
+from server.utils.scheduler import release
+
+# Newest head SHA per (repo, PR) and the id of the process_pr job queued for
+# it. A push supersedes every older head: its queued job is cancelled and a
+# job already running stops at the next stage boundary (is_superseded).
+# Heads that were replaced are remembered, and the head only moves forward in
+# pull_request.updated_at order, so a late or redelivered webhook for an older
+# push cannot take the PR back to it.
+PR_HEAD_KEY_PREFIX = "codedaddy:pr_head_v2"
+PR_SUPERSEDED_KEY_PREFIX = "codedaddy:pr_superseded"
+PR_JOB_KEY_PREFIX = "codedaddy:pr_job"
+PR_HEAD_TTL_SECONDS = 7 * 24 * 3600
+
+
+def _head_key(repo_name, pr_number):
+    return f"{PR_HEAD_KEY_PREFIX}:{repo_name}:{pr_number}"
+
+
+def _superseded_key(repo_name, pr_number):
+    return f"{PR_SUPERSEDED_KEY_PREFIX}:{repo_name}:{pr_number}"
+
+
+def _job_key(repo_name, pr_number):
+    return f"{PR_JOB_KEY_PREFIX}:{repo_name}:{pr_number}"
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def record_pr_head(connection, repo_name, pr_number, commit_sha, updated_at=None):
+    """
+    Mark commit_sha as the head every job of this PR should be working on.
+    Returns False (head unchanged) when commit_sha was already superseded or
+    updated_at is older than the recorded head's.
+    """
+    if not commit_sha:
+        return True
+    head_key = _head_key(repo_name, pr_number)
+    superseded_key = _superseded_key(repo_name, pr_number)
+    result = {}
+
+    def advance(pipe):
+        head = {_text(k): _text(v) for k, v in pipe.hgetall(head_key).items()}
+        result["current"] = True
+        if head.get("sha") == commit_sha:
+            return
+        if updated_at and head.get("updated_at"):
+            # Timestamps decide when both are known (a force-push back to an
+            # earlier SHA is newer); the superseded set covers the rest.
+            result["current"] = updated_at >= head["updated_at"]
+        else:
+            result["current"] = not pipe.sismember(superseded_key, commit_sha)
+        pipe.multi()
+        if result["current"]:
+            pipe.hset(head_key, mapping={"sha": commit_sha, "updated_at": updated_at or ""})
+            pipe.expire(head_key, PR_HEAD_TTL_SECONDS)
+            pipe.srem(superseded_key, commit_sha)
+            if head.get("sha"):
+                pipe.sadd(superseded_key, head["sha"])
+        else:
+            pipe.sadd(superseded_key, commit_sha)
+        pipe.expire(superseded_key, PR_HEAD_TTL_SECONDS)
+
+    try:
+        connection.transaction(advance, head_key, superseded_key)
+    except Exception as e:
+        print(f"[PRJobs] Failed to record head: {e}")
+        return True
+    return result["current"]
+
+
+def is_superseded(connection, repo_name, pr_number, commit_sha):
+    """True when a newer head was pushed after this job was enqueued."""
+    if not commit_sha:
+        return False
+    try:
+        latest = _text(connection.hget(_head_key(repo_name, pr_number), "sha"))
+    except Exception as e:
+        print(f"[PRJobs] Failed to read head: {e}")
+        return False
+    return bool(latest) and latest != commit_sha
+
+
+def replace_queued_job(connection, repo_name, pr_number, job_id):
+    """
+    Register job_id as the PR's pending job and cancel the one it replaces if
+    that is still waiting in the scheduler or the queue. Jobs already running are left to stop
+    themselves at their next is_superseded check.
+    """
+    try:
+        previous = _text(connection.getset(_job_key(repo_name, pr_number), job_id))
+        connection.expire(_job_key(repo_name, pr_number), PR_HEAD_TTL_SECONDS)
+    except Exception as e:
+        print(f"[PRJobs] Failed to register job: {e}")
+        return None
+    if not previous or previous == job_id:
+        return None
+    try:
+        job = Job.fetch(previous, connection=connection)
+    except NoSuchJobError:
+        return None
+    # "deferred": still parked in the scheduler's pending list.
+    if job.get_status() not in ("queued", "deferred"):
+        return None
+    job.cancel()
+    print(f"[PRJobs] Cancelled queued job {previous} for {repo_name}#{pr_number}")
+    job_data = job.args[0] if job.args else {}
+    release(connection, job_data, previous)
+    discard_progress_comment(job_data)
+    release_review_claim(connection, repo_name, pr_number, job_data.get("commit_sha"))
+    return previous
+
+
+def discard_progress_comment(job_data):
+    """Remove the 'review in progress' comment of a job that will not publish a review."""
+    comment_id = job_data.get("progress_comment_id")
+    if not comment_id:
+        return
+    try:
+        delete_pr_comment(comment_id, job_data.get("owner"), job_data.get("repo"), job_data.get("installation_id"))
+    except Exception as e:
+        print(f"[PRJobs] Failed to delete progress comment {comment_id}: {e}")
+
+
+def drop_if_superseded(connection, job_data, stage):
+    """Stage-boundary check: True (and the progress comment removed) if the job should stop."""
+    if not is_superseded(connection, job_data.get("repo_name"), job_data.get("pr_number"), job_data.get("commit_sha")):
+        return False
+    print(f"[PRJobs] {job_data.get('repo_name')}#{job_data.get('pr_number')} at "
+          f"{(job_data.get('commit_sha') or '')[:7]} superseded by a newer push, stopping before {stage}")
+    discard_progress_comment(job_data)
+    release_review_claim(connection, job_data.get("repo_name"), job_data.get("pr_number"), job_data.get("commit_sha"))
+    return True
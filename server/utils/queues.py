@@ -0,0 +1,14 @@
+import os
+
+# One rq queue per pipeline stage, so each stage runs on its own worker pool
+# and scales on its own:
+#   PR_QUEUE      process_pr: clone, parse, build context (CPU and disk bound),
+#                 served by forking `rq worker` processes
+#   PR_FAST_QUEUE process_pr for small PRs (see server.utils.scheduler), listed
+#                 first by the PR workers and also served by a dedicated one
+#   REVIEW_QUEUE  process_ai_job: LLM agents (network bound), served by the
+#                 threaded worker in server.agentic.review_worker
+PR_QUEUE = os.getenv("PR_QUEUE", "github_prs")
+PR_FAST_QUEUE = os.getenv("PR_FAST_QUEUE", "github_prs_fast")
+REVIEW_QUEUE = os.getenv("REVIEW_QUEUE", "pr_context_queue")
+REVIEW_JOB_TIMEOUT = int(os.getenv("REVIEW_JOB_TIMEOUT", "600"))
@@ -0,0 +1,147 @@
+import os
+import re
+import json
+
+# Last completed review per (repo, PR): the head SHA it covered, its findings
+# and the posted comment body. Used for incremental reviews on synchronize.
+REVIEW_KEY_PREFIX = "codedaddy:review"
+REVIEW_TTL_SECONDS = 30 * 24 * 3600
+
+# Idempotency per (repo, PR, head SHA, pipeline version): a claim taken when
+# the webhook accepts a delivery, and the review body once one was posted.
+# Bump PIPELINE_VERSION when a pipeline change should re-review old heads.
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "1")
+REVIEW_CLAIM_KEY_PREFIX = "codedaddy:review_claim"
+REVIEW_SHA_KEY_PREFIX = "codedaddy:review_sha"
+# Longer than a full pipeline run; a crashed run frees its claim when it expires.
+REVIEW_CLAIM_TTL_SECONDS = int(os.getenv("REVIEW_CLAIM_TTL_SECONDS", "3600"))
+
+FINDING_KEYS = ("security_issues", "code_quality_issues", "performance_issues", "test_suggestions")
+# A path only counts as mentioned when it is not part of a longer path: no
+# path character before it ("a.py" is not in "data.py"), and none after it
+# except a sentence-ending period.
+_PATH_START = r"(?<![\w/.-])"
+_PATH_END = r"(?![\w/-]|\.[\w/-])"
+
+
+def _review_key(repo_name, pr_number):
+    return f"{REVIEW_KEY_PREFIX}:{repo_name}:{pr_number}"
+
+
+def _sha_key(prefix, repo_name, pr_number, commit_sha):
+    return f"{prefix}:{repo_name}:{pr_number}:{commit_sha}:{PIPELINE_VERSION}"
+
+
+def get_last_review(connection, repo_name, pr_number):
+    """Return the stored review dict for this PR, or None."""
+    try:
+        raw = connection.get(_review_key(repo_name, pr_number))
+    except Exception as e:
+        print(f"[ReviewStore] Failed to read last review: {e}")
+        return None
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def finding_paths(finding, paths):
+    """The paths (from paths) that a finding's text names as a whole path."""
+    text = str(finding)
+    return [
+        path for path in paths
+        if re.search(_PATH_START + re.escape(path) + _PATH_END, text)
+    ]
+
+
+def save_review(connection, repo_name, pr_number, commit_sha, findings, final_review, pr_files=()):
+    """
+    Persist the review that was just posted for commit_sha. Each finding's
+    files (among pr_files) are stored next to it, for carry_over_findings.
+    """
+    record = {
+        "commit_sha": commit_sha,
+        "final_review": final_review or "",
+        **{key: list(findings.get(key) or []) for key in FINDING_KEYS},
+    }
+    record["finding_files"] = {
+        key: [finding_paths(finding, pr_files) for finding in record[key]] for key in FINDING_KEYS
+    }
+    try:
+        connection.set(_review_key(repo_name, pr_number), json.dumps(record), ex=REVIEW_TTL_SECONDS)
+        if commit_sha and final_review:
+            connection.set(
+                _sha_key(REVIEW_SHA_KEY_PREFIX, repo_name, pr_number, commit_sha), final_review,
+                ex=REVIEW_TTL_SECONDS
+            )
+    except Exception as e:
+        print(f"[ReviewStore] Failed to save review: {e}")
+
+
+def get_cached_review(connection, repo_name, pr_number, commit_sha):
+    """Review body already posted for this head SHA (same pipeline version), or None."""
+    if not commit_sha:
+        return None
+    try:
+        raw = connection.get(_sha_key(REVIEW_SHA_KEY_PREFIX, repo_name, pr_number, commit_sha))
+    except Exception as e:
+        print(f"[ReviewStore] Failed to read cached review: {e}")
+        return None
+    return raw.decode() if isinstance(raw, bytes) else raw
+
+
+def claim_review(connection, repo_name, pr_number, commit_sha):
+    """
+    Take the (repo, PR, SHA, version) claim. False means another delivery
+    already owns this head; Redis errors fail open so reviews still run.
+    """
+    if not commit_sha:
+        return True
+    try:
+        return bool(connection.set(
+            _sha_key(REVIEW_CLAIM_KEY_PREFIX, repo_name, pr_number, commit_sha), "1",
+            nx=True, ex=REVIEW_CLAIM_TTL_SECONDS
+        ))
+    except Exception as e:
+        print(f"[ReviewStore] Failed to claim review: {e}")
+        return True
+
+
+def release_review_claim(connection, repo_name, pr_number, commit_sha):
+    """Let a later delivery of this head run again (the run failed or was dropped)."""
+    if not commit_sha:
+        return
+    try:
+        connection.delete(_sha_key(REVIEW_CLAIM_KEY_PREFIX, repo_name, pr_number, commit_sha))
+    except Exception as e:
+        print(f"[ReviewStore] Failed to release review claim: {e}")
+
+
+def carry_over_findings(prior_review, pr_files, reanalyzed_files):
+    """
+    Findings from the prior review that still apply: those on a PR file which
+    was not re-analyzed, and on no file that was. Findings on re-analyzed
+    files are replaced by the new run. Findings that name no file are
+    dropped, because the new run reports its own general findings.
+    Files are compared as exact paths, using the ones stored by save_review.
+    """
+    carried = {key: [] for key in FINDING_KEYS}
+    if not prior_review:
+        return carried
+    reanalyzed = set(reanalyzed_files)
+    untouched = {path for path in pr_files if path not in reanalyzed}
+    stored = prior_review.get("finding_files") or {}
+    for key in FINDING_KEYS:
+        findings = prior_review.get(key, [])
+        files = stored.get(key)
+        if files is None or len(files) != len(findings):
+            # Reviews saved before files were stored with their findings.
+            files = [finding_paths(finding, set(pr_files) | reanalyzed) for finding in findings]
+        for finding, paths in zip(findings, files):
+            paths = set(paths)
+            if paths & reanalyzed or not paths & untouched:
+                continue
+            carried[key].append(finding)
+    return carried
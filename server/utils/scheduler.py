@@ -0,0 +1,147 @@
+import os
+import time
+
+from rq import Queue
+from rq.job import Job, JobStatus
+from rq.exceptions import NoSuchJobError
+
+from server.utils.queues import PR_QUEUE, PR_FAST_QUEUE
+
+# Fair scheduling of process_pr jobs in front of the rq queues.
+#
+# Webhooks don't enqueue directly: the job is created deferred and parked in
+# a per-installation pending list. dispatch() moves jobs into rq, per lane:
+#   - an installation has at most TENANT_MAX_CONCURRENCY jobs queued or
+#     running per lane; the rest wait in its pending list
+#   - among installations with a free slot, the one with the lowest virtual
+#     time goes first (start-time fair queueing); each dispatch charges it
+#     the PR's estimated cost divided by its weight (TENANT_WEIGHTS)
+#   - small PRs (by the payload's changed_files / additions + deletions) use
+#     the fast lane, a separate queue with its own slots, so a backlog of
+#     large PRs never delays them
+# dispatch() runs on every submit and whenever a job releases its slot.
+SCHED_KEY_PREFIX = "codedaddy:sched"
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "2"))
+# "installation_id:weight,..."; installations not listed have weight 1.
+TENANT_WEIGHTS = {
+    tenant.strip(): float(weight)
+    for tenant, weight in (
+        item.split(":", 1) for item in os.getenv("TENANT_WEIGHTS", "").split(",") if ":" in item
+    )
+}
+SMALL_PR_MAX_FILES = int(os.getenv("SMALL_PR_MAX_FILES", "10"))
+SMALL_PR_MAX_LINES = int(os.getenv("SMALL_PR_MAX_LINES", "400"))
+# A slot whose job never reported back (worker killed) is reclaimed after this.
+SCHED_SLOT_TTL_SECONDS = int(os.getenv("SCHED_SLOT_TTL_SECONDS", "1800"))
+
+LANES = {"fast": PR_FAST_QUEUE, "normal": PR_QUEUE}
+
+
+def _key(*parts):
+    return ":".join((SCHED_KEY_PREFIX,) + tuple(str(part) for part in parts))
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def pr_lane(size):
+    """"fast" for small PRs, "normal" otherwise."""
+    lines = size.get("additions", 0) + size.get("deletions", 0)
+    if size.get("changed_files", 0) <= SMALL_PR_MAX_FILES and lines <= SMALL_PR_MAX_LINES:
+        return "fast"
+    return "normal"
+
+
+def pr_cost(size):
+    """Rough relative work of a PR (1 for a one-file change)."""
+    return 1 + size.get("changed_files", 0) / 10 + (size.get("additions", 0) + size.get("deletions", 0)) / 1000
+
+
+def submit(connection, func, pr_data, retry=None):
+    """
+    Create the job deferred, park it in its installation's pending list and
+    dispatch whatever the caps allow. Returns the rq Job.
+    """
+    lane = pr_data.setdefault("lane", pr_lane(pr_data.get("size", {})))
+    tenant = pr_data.get("installation_id") or "default"
+    job = Queue(LANES[lane], connection=connection).create_job(
+        func, args=(pr_data,), retry=retry, status=JobStatus.DEFERRED
+    )
+    job.save()
+
+    with _lock(connection):
+        connection.rpush(_key("pending", lane, tenant), job.id)
+        connection.hset(_key("cost", lane), job.id, pr_cost(pr_data.get("size", {})))
+        # Newly active installations start at the lane's current virtual time.
+        clock = float(connection.get(_key("clock", lane)) or 0)
+        connection.zadd(_key("vtime", lane), {tenant: clock}, nx=True)
+        print(f"[Scheduler] {job.id} pending in lane '{lane}' for installation {tenant}")
+        _dispatch_all(connection)
+    return job
+
+
+def release(connection, pr_data, job_id):
+    """Free the slot of a finished (or failed) job and dispatch the next ones."""
+    lane = pr_data.get("lane")
+    if lane not in LANES or not job_id:
+        return
+    tenant = pr_data.get("installation_id") or "default"
+    try:
+        connection.zrem(_key("running", lane, tenant), job_id)
+        dispatch(connection)
+    except Exception as e:
+        print(f"[Scheduler] Failed to release {job_id}: {e}")
+
+
+def _lock(connection):
+    return connection.lock(_key("lock"), timeout=30, blocking_timeout=10)
+
+
+def dispatch(connection):
+    """Move pending jobs into rq, fairest installation first, within the per-installation caps."""
+    with _lock(connection):
+        _dispatch_all(connection)
+
+
+def _dispatch_all(connection):
+    for lane, queue_name in LANES.items():
+        queue = Queue(queue_name, connection=connection)
+        while _dispatch_one(connection, lane, queue):
+            pass
+
+
+def _dispatch_one(connection, lane, queue):
+    now = time.time()
+    for tenant, vtime in connection.zrange(_key("vtime", lane), 0, -1, withscores=True):
+        tenant = _text(tenant)
+        pending_key = _key("pending", lane, tenant)
+        if not connection.llen(pending_key):
+            # Idle installations leave the rotation; they rejoin at the clock.
+            connection.zrem(_key("vtime", lane), tenant)
+            continue
+        running_key = _key("running", lane, tenant)
+        connection.zremrangebyscore(running_key, "-inf", now)
+        if connection.zcard(running_key) >= TENANT_MAX_CONCURRENCY:
+            continue
+
+        job_id = _text(connection.lpop(pending_key))
+        cost = float(connection.hget(_key("cost", lane), job_id) or 1)
+        connection.hdel(_key("cost", lane), job_id)
+        try:
+            job = Job.fetch(job_id, connection=connection)
+        except NoSuchJobError:
+            return True
+        if job.get_status() != JobStatus.DEFERRED:
+            # Cancelled while pending (superseded by a newer push).
+            return True
+
+        connection.zadd(running_key, {job_id: now + SCHED_SLOT_TTL_SECONDS})
+        connection.set(_key("clock", lane), vtime)
+        connection.zincrby(_key("vtime", lane), cost / TENANT_WEIGHTS.get(tenant, 1.0), tenant)
+        # enqueue_job leaves DEFERRED jobs waiting (rq treats them as having dependencies).
+        job.set_status(JobStatus.QUEUED)
+        queue.enqueue_job(job)
+        print(f"[Scheduler] Dispatched {job_id} (lane '{lane}', installation {tenant})")
+        return True
+    return False
@@ -1,18 +1,35 @@
 import os
 import tempfile
-import shutil
-import networkx as nx
-import json
-import boto3
 from redis import Redis
-from rq import Queue
+from rq import Queue, get_current_job
 from dotenv import load_dotenv
-from .services.parser_utils import parse_file, extract_imports_with_tree_sitter, resolve_import_path, LANGUAGE_MAP
-from .services.write_pr_txt import write_pr_txt
-from .services.graph_utils import build_graph_from_ast, build_semantic_graph
+from .services.parser_utils import LANGUAGE_MAP
+from .services.repo_index import build_repo_index
+from .services.import_closure import expand_import_closure
+from .services.reverse_index import (
+    build_reverse_index, REVERSE_INDEX_ENABLED, REVERSE_INDEX_MAX_DEPENDENTS
+)
+from .services.write_pr_txt import write_pr_artifact
+from .services.symbol_index import CONTEXT_MODE
+from .services.context_select import select_context, touched_definitions
+from .services.parse_pool import parse_files
+from .services.graph_utils import AST_GRAPH, resolve_call_edges
+from .services.code_graph import CodeGraph
 from .services.llm_context import prepare_llm_context
-from .services.git_utils import clone_and_checkout, get_changed_files
+from .services.git_utils import (
+    clone_and_checkout, cleanup_checkout, get_changed_files, get_pr_diff, is_ancestor,
+    materialize_paths, get_blob_shas, get_tree_sha, PARTIAL_CLONE
+)
+from .services.parse_cache import ParseCache, PARSE_CACHE_REDIS
 from server.agentic.main import process_ai_job
+from server.utils.review_store import get_last_review, get_cached_review, release_review_claim
+from server.servcies.github import publish_pr_review
+from server.utils.pr_jobs import drop_if_superseded, discard_progress_comment
+from server.utils.context_budget import CONTEXT_TOKEN_BUDGET
+from server.utils.context_artifact import ContextArtifactWriter
+from server.utils.artifact_store import get_artifact_store
+from server.utils.queues import REVIEW_QUEUE, REVIEW_JOB_TIMEOUT
+from server.utils.scheduler import release
 
 load_dotenv()
 
@@ -26,27 +43,50 @@ except Exception as e:
     print("[Worker] Redis connection failed:", e)
     raise
 
-queue = Queue("pr_context_queue", connection=connection)
+queue = Queue(REVIEW_QUEUE, connection=connection)
 
+parse_cache = ParseCache(redis=connection if PARSE_CACHE_REDIS else None)
 
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION"),
-)
-bucket_name = os.getenv("S3_BUCKET")
-if not bucket_name:
-    raise ValueError("S3_BUCKET not set in environment variables")
 
-def upload_to_s3(file_path, key_prefix):
-    """Upload a file to S3 and return its S3 URI."""
-    file_name = os.path.basename(file_path)
-    s3_key = f"{key_prefix}/{file_name}"
-    s3_client.upload_file(file_path, bucket_name, s3_key)
-    return f"s3://{bucket_name}/{s3_key}"
+# Context/graph artifacts handed to the AI stage (S3, a shared directory, or both).
+artifact_store = get_artifact_store()
+
+def will_retry(job):
+    """
+    True when rq is going to run the failed job again: retries are left and,
+    for a delayed retry, a scheduler is running to move it back to the queue.
+    Otherwise the remaining retries are dropped, so rq fails the job for good
+    instead of parking it in the ScheduledJobRegistry.
+    """
+    if job is None or not job.should_retry:
+        return False
+    if not job.get_retry_interval() or Queue(job.origin, connection=connection).scheduler_pid:
+        return True
+    print(f"[Worker] No rq scheduler on '{job.origin}', not retrying {job.id}")
+    job.retries_left = 0
+    return False
+
 
 def process_pr(pr_data):
+    """rq entry point: runs the pipeline, then returns the installation's scheduler slot."""
+    job = get_current_job()
+    retrying = False
+    try:
+        return run_pr_pipeline(pr_data)
+    except Exception:
+        # A requeued attempt keeps the slot, the review claim and the progress comment.
+        retrying = will_retry(job)
+        if not retrying:
+            release_review_claim(connection, pr_data.get("repo_name"), pr_data.get("pr_number"),
+                                 pr_data.get("commit_sha"))
+            discard_progress_comment(pr_data)
+        raise
+    finally:
+        if not retrying:
+            release(connection, pr_data, job.id if job else None)
+
+
+def run_pr_pipeline(pr_data):
     print("pr_data",pr_data)
     repo_url = pr_data["clone_url"]
     pr_number = pr_data["pr_number"]
@@ -62,108 +102,205 @@ def process_pr(pr_data):
     repo = pr_data.get("repo")
     
     safe_repo_name = repo_name.replace("/", "_")
-    s3_prefix = f"pr_contexts/{safe_repo_name}_{pr_number}"
 
     print(f"[Worker] Reviewing PR #{pr_number} from {repo_name}")
 
+    if drop_if_superseded(connection, pr_data, "process_pr"):
+        return {"pr_number": pr_number, "repo": repo_name, "status": "superseded"}
+
+    # A retry or duplicate of a head that was already reviewed: re-post, don't recompute.
+    cached_review = get_cached_review(connection, repo_name, pr_number, commit_sha)
+    if cached_review is not None:
+        print(f"[Worker] Review for {commit_sha} already cached, re-posting")
+        publish_pr_review(pr_number, owner, repo, cached_review, installation_id, progress_comment_id)
+        return {"pr_number": pr_number, "repo": repo_name, "status": "cached"}
+
     temp_dir = tempfile.mkdtemp()
 
     try:
-        clone_and_checkout(repo_url, temp_dir, head_branch)
-        changed_files = get_changed_files(temp_dir, base_branch, head_branch)
+        # Diffs run against this base SHA and the worktree HEAD, both fixed at checkout.
+        base_sha = clone_and_checkout(repo_url, temp_dir, head_branch, base_branch, sparse=PARTIAL_CLONE)
+        pr_files = get_changed_files(temp_dir, base_sha)
+        changed_files = pr_files
+
+        # On synchronize, only re-analyze files touched since the last reviewed
+        # commit, as long as that commit is still part of the branch history.
+        since_sha = None
+        if pr_data.get("action") == "synchronize":
+            last_review = get_last_review(connection, repo_name, pr_number)
+            last_sha = last_review.get("commit_sha") if last_review else None
+            if last_sha and is_ancestor(temp_dir, last_sha):
+                since_sha = last_sha
+                pushed = set(get_changed_files(temp_dir, base_sha, since_sha=since_sha))
+                changed_files = [f for f in pr_files if f in pushed]
+                print(f"[Worker] Incremental review since {since_sha[:7]}: "
+                      f"{len(changed_files)}/{len(pr_files)} files")
+        review_mode = "incremental" if since_sha else "full"
+
+        queue_data = {
+            "pr_number": pr_number,
+            "repo_name": repo_name,
+            "repo_url": repo_url,
+            "total_files_changed": len(pr_files),
+            "commit_sha": commit_sha,
+            "progress_comment_id": progress_comment_id,
+            "installation_id": installation_id,
+            "owner": owner,
+            "repo": repo,
+            "review_mode": review_mode,
+            "since_sha": since_sha,
+            "pr_files": pr_files,
+            "reanalyzed_files": changed_files,
+        }
+
+        if since_sha and not changed_files:
+            # Nothing new to analyze; the AI stage re-posts the previous review.
+            print("[Worker] No PR files changed since last review")
+            if drop_if_superseded(connection, queue_data, "process_ai_job"):
+                return {"pr_number": pr_number, "repo": repo_name, "status": "superseded"}
+            queue.enqueue(process_ai_job, queue_data, job_timeout=REVIEW_JOB_TIMEOUT)
+            return {"pr_number": pr_number, "repo": repo_name, "changed_files": [], "review_mode": review_mode}
 
-        combined_graph = nx.DiGraph()
+        if PARTIAL_CLONE:
+            materialize_paths(temp_dir, changed_files)
+
+        # Import resolution is answered from this index, not from stat calls on the checkout.
+        repo_index = build_repo_index(temp_dir, cache=parse_cache)
+
+        combined_graph = CodeGraph()
         parsed_files = {}
+        # Compact syntax trees of files parsed in this job (AST_GRAPH=compact).
+        ast_trees = {}
+        blob_shas = get_blob_shas(temp_dir)
+
+        def parse_files_if_needed(file_names):
+            """Parse a batch of repo-relative files: cache hits first, the rest on the parse pool."""
+            pending = []
+            for file_name in dict.fromkeys(file_names):
+                if file_name in parsed_files:
+                    continue
+                ext = os.path.splitext(file_name)[1]
+                file_path = os.path.join(temp_dir, file_name)
+                if ext not in LANGUAGE_MAP or not os.path.exists(file_path):
+                    continue
+
+                # Unchanged blobs reuse facts from earlier jobs and skip tree-sitter entirely.
+                facts = parse_cache.get(blob_shas.get(file_name), file_name)
+                if facts is not None:
+                    combined_graph.add_facts(facts)
+                    parsed_files[file_name] = facts
+                    continue
+                pending.append((file_path, file_name, LANGUAGE_MAP[ext]))
+
+            for facts, cst in parse_files(pending, ast_mode=AST_GRAPH):
+                parse_cache.put(blob_shas.get(facts.path), facts.path, facts)
+                if AST_GRAPH == "networkx":
+                    for label in cst.nodes():
+                        combined_graph.add_node(label, path=facts.path, type="ast")
+                    combined_graph.add_edges(cst.edges(), edge_type="ast")
+                elif cst is not None:
+                    ast_trees[facts.path] = cst
+                combined_graph.add_facts(facts)
+                parsed_files[facts.path] = facts
+
+        parse_files_if_needed(changed_files)
 
-        def parse_file_if_needed(file_path, file_name):
-            if file_name in parsed_files:
-                return
-            ext = os.path.splitext(file_name)[1]
-            if ext not in LANGUAGE_MAP or not os.path.exists(file_path):
-                return
-
-            tree, source_code = parse_file(file_path, LANGUAGE_MAP[ext])
-            if isinstance(source_code, bytes):
-                source_code = source_code.decode("utf-8")
-
-            ast_graph = build_graph_from_ast(tree)
-            sem_graph = build_semantic_graph(tree, source_code, LANGUAGE_MAP[ext], file_name)
-            combined_graph.update(ast_graph)
-            combined_graph.update(sem_graph)
-            parsed_files[file_name] = (tree, source_code)
-            return tree, source_code
-
-        for file in changed_files:
-            parse_file_if_needed(os.path.join(temp_dir, file), file)
-
-        for current_file in list(parsed_files.keys()):
-            ext = os.path.splitext(current_file)[1]
-            lang = LANGUAGE_MAP.get(ext)
-            if not lang:
-                continue    
-            imports = extract_imports_with_tree_sitter(os.path.join(temp_dir, current_file), lang)
-            for imp in imports:
-                resolved_path = resolve_import_path(imp, current_file, temp_dir, lang)
-                if resolved_path and resolved_path not in parsed_files:
-                    parse_file_if_needed(os.path.join(temp_dir, resolved_path), resolved_path)
-                    combined_graph.add_edge(current_file, resolved_path, type="import")
+        # Breadth-first over imports, bounded by depth/file/byte budgets.
+        import_edges, import_distance = expand_import_closure(
+            changed_files, parsed_files, repo_index, parse_files_if_needed, temp_dir,
+            materialize=(lambda paths: materialize_paths(temp_dir, paths)) if PARTIAL_CLONE else None
+        )
+        combined_graph.add_edges(import_edges, edge_type="import")
+        # Call sites resolved to their definitions across all parsed files.
+        combined_graph.add_edges(resolve_call_edges(parsed_files, import_edges))
+
+        # Repo-wide dependents, updated from the last index built for this repo.
+        reverse_index = None
+        if REVERSE_INDEX_ENABLED:
+            reverse_index = build_reverse_index(
+                temp_dir, repo_url, get_tree_sha(temp_dir), blob_shas, repo_index,
+                cache=parse_cache, known_facts=parsed_files
+            )
+
+        print(f"[Worker] Parse cache totals: {parse_cache.hits} hits, {parse_cache.misses} misses")
+        parse_cache.evict()
+
+        pr_diff = get_pr_diff(temp_dir, base_sha, since_sha=since_sha)
 
         llm_context = prepare_llm_context(
-            parsed_files, changed_files, combined_graph,
-            temp_dir, base_branch, head_branch, LANGUAGE_MAP
+            parsed_files, changed_files, combined_graph, pr_diff,
+            reverse_index=reverse_index, max_dependents=REVERSE_INDEX_MAX_DEPENDENTS,
+            context_mode=CONTEXT_MODE, temp_dir=temp_dir
         )
 
+        # Definitions the diff touches: PageRank seeds here, marked in the graph artifact below.
+        touched = touched_definitions(parsed_files, changed_files, pr_diff)
+
+        # Graph-ranked snippets packed into the agents' token budget.
+        llm_context["selected_context"] = select_context(
+            combined_graph, parsed_files, changed_files, pr_diff, temp_dir, CONTEXT_TOKEN_BUDGET,
+            touched=touched
+        )
+        print(f"[Worker] Selected {len(llm_context['selected_context']['snippets'])} snippet(s), "
+              f"{llm_context['selected_context']['tokens_used']}/{CONTEXT_TOKEN_BUDGET} tokens")
+
         llm_context["pr_metadata"] = {
             "pr_number": pr_number,
             "repo_name": repo_name,
             "repo_url": repo_url,
             "base_branch": base_branch,
             "head_branch": head_branch,
-            "total_files_changed": len(changed_files)
+            "total_files_changed": len(pr_files),
+            "review_mode": review_mode,
+            "since_sha": since_sha,
+            "context_mode": CONTEXT_MODE
         }
 
-        context_json_path = os.path.join(temp_dir, f"pr_{safe_repo_name}_{pr_number}_context.json")
-        with open(context_json_path, "w", encoding="utf-8") as f:
-            json.dump(llm_context, f, indent=2)
+        # One zstd-framed artifact replaces the JSON + TXT pair; records are
+        # streamed to disk as they are produced and diffs are stored once.
+        context_path = os.path.join(temp_dir, f"pr_{safe_repo_name}_{pr_number}_context.cdctx")
+        with ContextArtifactWriter(context_path) as artifact:
+            write_pr_artifact(
+                artifact, llm_context, parsed_files, changed_files, pr_diff, import_distance, temp_dir,
+                context_mode=CONTEXT_MODE
+            )
 
-        context_txt_path = write_pr_txt(
-            pr_data, parsed_files, changed_files, temp_dir, temp_dir,
-            file_name=os.path.join(temp_dir, f"pr_{safe_repo_name}_{pr_number}_context.txt")
-        )
+        # Call/import graph for the AI stage, as CSR arrays plus a string table.
+        graph_path = os.path.join(temp_dir, f"pr_{safe_repo_name}_{pr_number}_graph.bin")
+        with open(graph_path, "wb") as f:
+            f.write(combined_graph.serialize(touched=touched[0]))
 
-        s3_json_uri = upload_to_s3(context_json_path, s3_prefix)
-        s3_txt_uri = upload_to_s3(context_txt_path, s3_prefix)
-        print(f"[Worker] Uploaded context files to S3: {s3_json_uri}, {s3_txt_uri}")
+        # Scoped to this job: the AI stage deletes its artifacts once consumed.
+        artifact_scope = f"{repo_name}#{pr_number}@{commit_sha}"
+        context_uri = artifact_store.put_file(context_path, scope=artifact_scope)
+        graph_uri = artifact_store.put_file(graph_path, scope=artifact_scope)
+        artifact_store.evict()
+        print(f"[Worker] Stored context artifacts: {context_uri} "
+              f"({os.path.getsize(context_path)} bytes), {graph_uri}")
 
-        queue_data = {
-            "pr_number": pr_number,
-            "repo_name": repo_name,
-            "repo_url": repo_url,
-            "context_json": s3_json_uri,
-            "context_txt": s3_txt_uri,
-            "total_files_changed": len(changed_files),
-            "commit_sha": commit_sha,
-            "progress_comment_id": progress_comment_id,
-            "installation_id": installation_id,
-            "owner": owner,
-            "repo": repo
-        }
+        queue_data["context_artifact"] = context_uri
+        queue_data["graph_artifact"] = graph_uri
         print("queue",queue_data)
-        queue.enqueue(process_ai_job, queue_data,job_timeout=600)
+        if drop_if_superseded(connection, queue_data, "process_ai_job"):
+            for uri in (context_uri, graph_uri):
+                artifact_store.delete(uri)
+            return {"pr_number": pr_number, "repo": repo_name, "status": "superseded"}
+        queue.enqueue(process_ai_job, queue_data, job_timeout=REVIEW_JOB_TIMEOUT)
 
         return {
             "pr_number": pr_number,
             "repo": repo_name,
             "changed_files": changed_files,
-            "context_json": s3_json_uri,
-            "context_txt": s3_txt_uri,
+            "review_mode": review_mode,
+            "context_artifact": context_uri,
+            "graph_artifact": graph_uri,
             "llm_context": llm_context,
             "progress_comment_id": progress_comment_id
         }
 
     except Exception as e:
         print(f"[Worker] Error: {e}")
-        return {"error": str(e)}
+        raise
 
     finally:
-        shutil.rmtree(temp_dir)
\ No newline at end of file
+        cleanup_checkout(repo_url, temp_dir)
\ No newline at end of file
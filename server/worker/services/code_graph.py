@@ -0,0 +1,87 @@
+from collections import defaultdict
+
+import networkx as nx
+
+from server.utils.graph_artifact import encode_graph
+
+
+class CodeGraph:
+    """
+    Typed code graph for one job: semantic nodes, import edges between files
+    and resolved call edges. Every edge type has its own forward and reverse
+    adjacency index, and nodes are indexed by the file they belong to, so
+    lookups such as "files importing X" or "callers of f" are dict accesses
+    instead of scans over all edges.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self._out = defaultdict(lambda: defaultdict(dict))
+        self._in = defaultdict(lambda: defaultdict(dict))
+        self._by_file = defaultdict(set)
+
+    def add_node(self, label, path=None, **attrs):
+        self.nodes.setdefault(label, {}).update(attrs)
+        if path is not None:
+            self._by_file[path].add(label)
+
+    def add_edge(self, src, dst, edge_type, **attrs):
+        self.nodes.setdefault(src, {})
+        self.nodes.setdefault(dst, {})
+        attrs["type"] = edge_type
+        self._out[edge_type][src][dst] = attrs
+        self._in[edge_type][dst][src] = attrs
+
+    def add_edges(self, edges, edge_type=None):
+        """Add (src, dst) or (src, dst, attrs) edges; attrs["type"] wins over edge_type."""
+        for edge in edges:
+            attrs = dict(edge[2]) if len(edge) > 2 else {}
+            self.add_edge(edge[0], edge[1], attrs.pop("type", edge_type), **attrs)
+
+    def add_facts(self, facts):
+        """Merge one file's semantic nodes and edges, indexed under its path."""
+        for label, attrs in facts.sem_nodes:
+            self.add_node(label, path=facts.path, **attrs)
+        self.add_edges(facts.sem_edges)
+
+    def successors(self, node, edge_type):
+        return list(self._out[edge_type].get(node, ()))
+
+    def predecessors(self, node, edge_type):
+        return list(self._in[edge_type].get(node, ()))
+
+    def edges(self, edge_type=None):
+        """(src, dst, attrs) for one edge type, or for all of them."""
+        types = [edge_type] if edge_type is not None else list(self._out)
+        for current in types:
+            for src, targets in self._out[current].items():
+                for dst, attrs in targets.items():
+                    yield src, dst, attrs
+
+    def edge_types(self):
+        return [edge_type for edge_type, index in self._out.items() if index]
+
+    def nodes_in_file(self, path):
+        return self._by_file.get(path, set())
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return sum(len(targets) for index in self._out.values() for targets in index.values())
+
+    def to_networkx(self):
+        """networkx view for consumers that want graph algorithms (edges of one type per pair)."""
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes.items())
+        graph.add_edges_from(self.edges())
+        return graph
+
+    def serialize(self, touched=(), skip_types=("ast",)):
+        """Compact binary artifact (server.utils.graph_artifact) without AST nodes/edges."""
+        node_paths = {label: path for path, labels in self._by_file.items() for label in labels}
+        nodes = {label: attrs for label, attrs in self.nodes.items() if attrs.get("type") not in skip_types}
+        edges_by_type = {
+            edge_type: self.edges(edge_type) for edge_type in self.edge_types() if edge_type not in skip_types
+        }
+        return encode_graph(nodes, edges_by_type, node_paths=node_paths, touched=touched)
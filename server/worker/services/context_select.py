@@ -0,0 +1,177 @@
+from collections import defaultdict
+
+from server.utils.context_budget import rendered_tokens, CHARS_PER_TOKEN
+from .symbol_index import SymbolIndex, read_source_lines
+from .write_pr_txt import elide_diff
+
+# Edge types of combined_graph that carry relevance, with the weight used when
+# walking them backwards (a caller matters to its callee, but less).
+RANK_EDGE_TYPES = {"contains": 1.0, "calls": 0.5, "import": 0.5, "has_decorator": 0.5, "imports": 0.5}
+
+
+def personalized_pagerank(adjacency, seeds, alpha=0.85, max_iter=50, tol=1e-6):
+    """
+    Power iteration for PageRank restarted at `seeds` ({node: weight}).
+    adjacency maps node -> {neighbour: weight}. Pure Python, so no scipy
+    is needed; graphs here are a few thousand nodes.
+    """
+    total = sum(seeds.values())
+    if not total:
+        return {}
+    restart = {node: weight / total for node, weight in seeds.items()}
+    out_weight = {node: sum(neighbours.values()) for node, neighbours in adjacency.items()}
+    rank = dict(restart)
+
+    for _ in range(max_iter):
+        nxt = defaultdict(float)
+        dangling = 0.0
+        for node, score in rank.items():
+            weight = out_weight.get(node)
+            if not weight:
+                dangling += score
+                continue
+            for neighbour, edge_weight in adjacency[node].items():
+                nxt[neighbour] += alpha * score * edge_weight / weight
+        for node, share in restart.items():
+            nxt[node] += (1 - alpha + alpha * dangling) * share
+        delta = sum(abs(nxt[node] - rank.get(node, 0.0)) for node in nxt)
+        rank = nxt
+        if delta < tol:
+            break
+    return dict(rank)
+
+
+def _rank_adjacency(combined_graph, parsed_files):
+    adjacency = defaultdict(lambda: defaultdict(float))
+
+    def link(a, b, weight):
+        adjacency[a][b] += weight
+
+    for edge_type, reverse in RANK_EDGE_TYPES.items():
+        for src, dst, data in combined_graph.edges(edge_type):
+            weight = float(data.get("weight", 1))
+            link(src, dst, weight)
+            link(dst, src, weight * reverse)
+
+    # Tie definitions to their file so import edges (file -> file) reach them.
+    for path in parsed_files:
+        for label in combined_graph.nodes_in_file(path):
+            if combined_graph.nodes[label].get("type") in ("function", "class"):
+                link(path, label, 1.0)
+                link(label, path, 1.0)
+    return adjacency
+
+
+def _definition_labels(facts):
+    """(start_line, name) -> semantic node label for a file's named definitions."""
+    return {
+        (attrs["span"][0][0] + 1, attrs["name"]): label
+        for label, attrs in facts.sem_nodes
+        if attrs.get("type") in ("function", "class") and not attrs.get("anonymous")
+    }
+
+
+def touched_definitions(parsed_files, changed_files, pr_diff):
+    """
+    Semantic labels of the definitions the diff touches, and the changed
+    files in which it touches none.
+    """
+    labels = []
+    untouched_files = []
+    for path in changed_files:
+        facts = parsed_files.get(path)
+        file_diff = pr_diff.get(path)
+        if facts is None:
+            continue
+        by_position = _definition_labels(facts)
+        index = SymbolIndex(facts.definitions)
+        touched = index.touched(file_diff.hunks) if file_diff else []
+        for i in touched:
+            definition = index.definitions[i]
+            label = by_position.get((definition["start_line"], definition["name"]))
+            if label:
+                labels.append(label)
+        if not touched:
+            untouched_files.append(path)
+    return labels, untouched_files
+
+
+def select_context(combined_graph, parsed_files, changed_files, pr_diff, temp_dir, token_budget, touched=None):
+    """
+    Rank definitions by personalized PageRank seeded at the definitions the
+    diff touches (or the changed files when no definition is touched), then
+    greedily pack the budget: diffs of changed files first, then definition
+    bodies by descending rank, skipping spans that overlap one already taken.
+    Diffs share the budget evenly (what a small diff leaves goes to the next)
+    and are truncated to their share rather than dropped.
+    touched is touched_definitions()'s result when the caller already has it.
+    """
+    touched, untouched_files = touched or touched_definitions(parsed_files, changed_files, pr_diff)
+    seeds = {node: 1.0 for node in touched + untouched_files}
+
+    rank = personalized_pagerank(_rank_adjacency(combined_graph, parsed_files), seeds)
+
+    snippets = []
+    used = 0
+
+    def take(snippet):
+        nonlocal used
+        # Charged as rendered, so the prompt block stays within token_budget.
+        snippet["tokens"] = rendered_tokens(snippet)
+        if used + snippet["tokens"] > token_budget:
+            return False
+        used += snippet["tokens"]
+        snippets.append(snippet)
+        return True
+
+    # Lockfile / vendored / minified diffs are reduced to a note, as in the text context.
+    diffs = [(path, pr_diff.patch(path)) for path in changed_files]
+    diffs = [(path, elide_diff(path, diff_text)) for path, diff_text in diffs if diff_text]
+    truncated_marker = "\n...[truncated]..."
+    for index, (path, diff_text) in enumerate(diffs):
+        share = (token_budget - used) // (len(diffs) - index)
+        snippet = {"kind": "diff", "path": path, "score": None, "code": diff_text}
+        if rendered_tokens(snippet) > share:
+            overhead = rendered_tokens({**snippet, "code": truncated_marker})
+            keep = (share - overhead) * CHARS_PER_TOKEN - 1
+            if keep <= 0:
+                continue
+            snippet["code"] = diff_text[:keep] + truncated_marker
+            snippet["truncated"] = True
+        take(snippet)
+
+    candidates = []
+    for path, facts in parsed_files.items():
+        for label, attrs in facts.sem_nodes:
+            if attrs.get("type") in ("function", "class") and not attrs.get("anonymous") and rank.get(label):
+                candidates.append((rank[label], label, path, attrs))
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+    sources = {}
+    taken_spans = defaultdict(list)
+    for score, label, path, attrs in candidates:
+        if used >= token_budget:
+            break
+        start_line = attrs["span"][0][0] + 1
+        end_line = attrs["span"][1][0] + 1
+        if any(start_line <= end and start <= end_line for start, end in taken_spans[path]):
+            continue
+        if path not in sources:
+            sources[path] = read_source_lines(temp_dir, path)
+        lines = sources[path]
+        if lines is None:
+            continue
+        snippet = {
+            "kind": "definition",
+            "path": path,
+            "name": attrs["name"],
+            "qualified_name": attrs["qualified_name"],
+            "start_line": start_line,
+            "end_line": end_line,
+            "score": round(score, 6),
+            "code": "\n".join(lines[start_line - 1:end_line]),
+        }
+        if take(snippet):
+            taken_spans[path].append((start_line, end_line))
+
+    return {"token_budget": token_budget, "tokens_used": used, "snippets": snippets}
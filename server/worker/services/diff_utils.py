@@ -0,0 +1,185 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)$")
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_lines: int
+    new_start: int
+    new_lines: int
+    section: str = ""
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def new_end(self) -> int:
+        """Last line of the hunk on the head side (inclusive)."""
+        return self.new_start + max(self.new_lines, 1) - 1
+
+    @property
+    def old_end(self) -> int:
+        return self.old_start + max(self.old_lines, 1) - 1
+
+    def changed_ranges(self) -> List[tuple]:
+        """
+        Head-side (start, end) line runs actually changed, without git's context
+        lines. Added lines count as themselves (a removal followed by additions
+        is a replacement); a pure removal counts as the head line just before
+        it, or the line after at the top of the file.
+        """
+        changed = []
+        new_line = self.new_start
+        removed = False
+        for line in self.lines:
+            if line.startswith("+"):
+                changed.append(new_line)
+                new_line += 1
+                removed = False
+            elif line.startswith("-"):
+                removed = True
+            elif line.startswith(" ") or line == "":
+                if removed:
+                    changed.append(max(new_line - 1, 1))
+                    removed = False
+                new_line += 1
+        if removed:
+            changed.append(max(new_line - 1, 1))
+        ranges = []
+        for number in sorted(set(changed)):
+            if ranges and number == ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], number)
+            else:
+                ranges.append((number, number))
+        return ranges
+
+    def header(self) -> str:
+        text = f"@@ -{self.old_start},{self.old_lines} +{self.new_start},{self.new_lines} @@"
+        return f"{text} {self.section}" if self.section else text
+
+    def to_dict(self) -> dict:
+        return {
+            "old_start": self.old_start,
+            "old_end": self.old_end,
+            "new_start": self.new_start,
+            "new_end": self.new_end,
+            "section": self.section,
+        }
+
+
+@dataclass
+class FileDiff:
+    path: str
+    old_path: Optional[str] = None
+    status: str = "modified"
+    binary: bool = False
+    header: List[str] = field(default_factory=list)
+    hunks: List[Hunk] = field(default_factory=list)
+
+    @property
+    def patch(self) -> str:
+        out = list(self.header)
+        for hunk in self.hunks:
+            out.append(hunk.header())
+            out.extend(hunk.lines)
+        return "\n".join(out) + "\n" if out else ""
+
+    def hunk_ranges(self) -> List[dict]:
+        return [h.to_dict() for h in self.hunks]
+
+
+class PRDiff:
+    """
+    Whole-PR diff produced by a single `git diff` call, indexed by head-side path.
+    Shared by the JSON and TXT context writers.
+    """
+
+    def __init__(self, files: Iterable[FileDiff] = ()):
+        self.files: Dict[str, FileDiff] = {f.path: f for f in files}
+
+    def __contains__(self, path):
+        return path in self.files
+
+    def get(self, path) -> Optional[FileDiff]:
+        return self.files.get(path)
+
+    def patch(self, path) -> str:
+        file_diff = self.files.get(path)
+        return file_diff.patch if file_diff else ""
+
+    def hunk_ranges(self, path) -> List[dict]:
+        file_diff = self.files.get(path)
+        return file_diff.hunk_ranges() if file_diff else []
+
+
+def _path_from_git_header(line):
+    # "diff --git a/<p> b/<p>" — only unambiguous when both sides are equal,
+    # which holds for everything except renames (handled via rename lines).
+    rest = line[len("diff --git "):]
+    half = (len(rest) - 1) // 2
+    old, new = rest[:half], rest[half + 1:]
+    if old.startswith("a/") and new.startswith("b/") and old[2:] == new[2:]:
+        return old[2:]
+    return new[2:] if new.startswith("b/") else new
+
+
+def _parse_hunk_header(line) -> Optional[Hunk]:
+    match = HUNK_HEADER.match(line)
+    if not match:
+        return None
+    old_start, old_lines, new_start, new_lines, section = match.groups()
+    return Hunk(
+        old_start=int(old_start),
+        old_lines=int(old_lines) if old_lines is not None else 1,
+        new_start=int(new_start),
+        new_lines=int(new_lines) if new_lines is not None else 1,
+        section=section.strip(),
+    )
+
+
+def parse_unified_diff(lines: Iterable[str]) -> PRDiff:
+    """Split a unified patch stream (lines without trailing newlines) into per-file hunks."""
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            current = FileDiff(path=_path_from_git_header(line), header=[line])
+            files.append(current)
+            hunk = None
+            continue
+        if current is None:
+            continue
+
+        new_hunk = _parse_hunk_header(line) if line.startswith("@@") else None
+        if new_hunk:
+            hunk = new_hunk
+            current.hunks.append(hunk)
+            continue
+
+        if hunk is not None:
+            hunk.lines.append(line)
+            continue
+
+        current.header.append(line)
+        if line.startswith("new file mode"):
+            current.status = "added"
+        elif line.startswith("deleted file mode"):
+            current.status = "deleted"
+        elif line.startswith("rename from "):
+            current.status = "renamed"
+            current.old_path = line[len("rename from "):]
+        elif line.startswith("rename to "):
+            current.path = line[len("rename to "):]
+        elif line.startswith("Binary files "):
+            current.binary = True
+        elif line.startswith("+++ b/"):
+            # git appends a tab to ---/+++ paths that contain spaces
+            current.path = line[len("+++ b/"):].rstrip("\t")
+        elif line.startswith("--- a/") and current.old_path is None:
+            current.old_path = line[len("--- a/"):].rstrip("\t")
+
+    return PRDiff(files)
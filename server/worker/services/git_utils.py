@@ -1,16 +1,306 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
 import subprocess
+from contextlib import contextmanager
+from .diff_utils import PRDiff, parse_unified_diff
 
-def clone_and_checkout(repo_url, temp_dir, branch):
-    subprocess.run(["git", "clone", repo_url, temp_dir], check=True)
-    subprocess.run(["git", "fetch", "origin", branch], cwd=temp_dir, check=True)
-    subprocess.run(["git", "checkout", branch], cwd=temp_dir, check=True)
+# One bare mirror per clone_url lives here and is reused across jobs.
+# Each job only fetches its base/head refs and gets its own worktree.
+MIRROR_CACHE_DIR = os.getenv(
+    "GIT_MIRROR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "codedaddy_mirrors")
+)
+MIRROR_CACHE_MAX_BYTES = int(os.getenv("GIT_MIRROR_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
 
-def get_changed_files(temp_dir, base_branch, head_branch):
-    diff_cmd = ["git", "diff", "--name-only", f"origin/{base_branch}...origin/{head_branch}"]
+# Blobless mirrors + sparse worktrees: only the blobs for files we actually
+# read (changed files and resolved imports) are fetched, on demand.
+PARTIAL_CLONE = os.getenv("GIT_PARTIAL_CLONE", "false").lower() == "true"
+
+
+def _mirror_path(repo_url):
+    digest = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:16]
+    name = os.path.basename(repo_url).replace(".git", "") or "repo"
+    return os.path.join(MIRROR_CACHE_DIR, f"{name}-{digest}.git")
+
+
+@contextmanager
+def _mirror_lock(mirror_dir, blocking=True):
+    """
+    Serialize fetch/worktree operations on a mirror across worker processes.
+    Yields False instead of waiting when blocking=False and the lock is held.
+    """
+    os.makedirs(MIRROR_CACHE_DIR, exist_ok=True)
+    with open(mirror_dir + ".lock", "w") as lock_file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _has_worktrees(mirror_dir):
+    worktrees = os.path.join(mirror_dir, "worktrees")
+    return os.path.isdir(worktrees) and bool(os.listdir(worktrees))
+
+
+def evict_mirrors(keep=None):
+    """
+    Drop least-recently-used mirrors until the cache fits MIRROR_CACHE_MAX_BYTES.
+    Mirrors that are locked or still have live worktrees are never evicted.
+    """
+    if not os.path.isdir(MIRROR_CACHE_DIR):
+        return
+
+    mirrors = []
+    for entry in os.listdir(MIRROR_CACHE_DIR):
+        path = os.path.join(MIRROR_CACHE_DIR, entry)
+        if entry.endswith(".git") and os.path.isdir(path):
+            mirrors.append((os.path.getmtime(path), path, _dir_size(path)))
+
+    total = sum(size for _, _, size in mirrors)
+    for _, path, size in sorted(mirrors):
+        if total <= MIRROR_CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        with _mirror_lock(path, blocking=False) as acquired:
+            if not acquired or _has_worktrees(path):
+                continue
+            print(f"[Git] Evicting mirror {path} ({size} bytes)")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _ref_specs(branches):
+    return [f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches]
+
+
+def _update_mirror(mirror_dir, repo_url, branches):
+    """Create mirror_dir if needed and fetch the given branches. Caller holds the mirror lock."""
+    if not os.path.isdir(mirror_dir):
+        subprocess.run(["git", "init", "--bare", "--quiet", mirror_dir], check=True)
+        subprocess.run(["git", "remote", "add", "origin", repo_url], cwd=mirror_dir, check=True)
+        if PARTIAL_CLONE:
+            subprocess.run(["git", "config", "remote.origin.promisor", "true"], cwd=mirror_dir, check=True)
+            subprocess.run(
+                ["git", "config", "remote.origin.partialclonefilter", "blob:none"],
+                cwd=mirror_dir, check=True
+            )
+
+    subprocess.run(
+        ["git", "fetch", "--quiet", "--no-tags", "origin", *_ref_specs(branches)],
+        cwd=mirror_dir, check=True
+    )
+    os.utime(mirror_dir, None)
+
+
+def _rev_parse(cwd, rev):
+    result = subprocess.run(["git", "rev-parse", "--verify", f"{rev}^{{commit}}"],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def ensure_mirror(repo_url, branches):
+    """
+    Create the bare mirror for repo_url if needed and fetch only the given branches.
+    Returns the mirror path.
+    """
+    mirror_dir = _mirror_path(repo_url)
+    with _mirror_lock(mirror_dir):
+        _update_mirror(mirror_dir, repo_url, [b for b in dict.fromkeys(branches) if b])
+    return mirror_dir
+
+
+def clone_and_checkout(repo_url, temp_dir, branch, base_branch=None, sparse=False):
+    """
+    Materialize `branch` into temp_dir as a detached worktree of the cached mirror.
+    temp_dir must be empty (e.g. a fresh tempfile.mkdtemp()).
+
+    Returns the SHA base_branch pointed to at fetch time (None without a
+    base_branch). Diffs use it and the worktree HEAD, never the origin/*
+    refs, which move whenever another job fetches the same mirror.
+
+    With sparse=True the index is populated but no files are written;
+    call materialize_paths() for the files that are actually needed.
+    """
+    start = time.time()
+    mirror_dir = _mirror_path(repo_url)
+
+    # One lock hold from fetch to `worktree add`: evict_mirrors skips locked
+    # mirrors and ones with worktrees, so the mirror can't vanish in between.
+    with _mirror_lock(mirror_dir):
+        _update_mirror(mirror_dir, repo_url, [b for b in dict.fromkeys([base_branch, branch]) if b])
+        head_sha = _rev_parse(mirror_dir, f"origin/{branch}")
+        base_sha = _rev_parse(mirror_dir, f"origin/{base_branch}") if base_branch else None
+        cmd = ["git", "worktree", "add", "--detach", "--force"]
+        if sparse:
+            cmd.append("--no-checkout")
+        subprocess.run([*cmd, temp_dir, head_sha], cwd=mirror_dir, check=True)
+
+    if sparse:
+        # An empty pattern list matches nothing, so checkout only fills the index.
+        subprocess.run(
+            ["git", "sparse-checkout", "set", "--no-cone", "--stdin"],
+            cwd=temp_dir, input="", text=True, check=True
+        )
+        subprocess.run(["git", "checkout", "--quiet", "--detach"], cwd=temp_dir, check=True)
+
+    print(f"[Git] Checked out {branch} ({head_sha[:7]}) from mirror in {time.time() - start:.2f}s")
+    evict_mirrors(keep=mirror_dir)
+    return base_sha
+
+
+def _sparse_pattern(path):
+    escaped = "".join("\\" + ch if ch in "*?[]\\" else ch for ch in path)
+    return "/" + escaped
+
+
+def materialize_paths(temp_dir, paths):
+    """
+    Add paths to a sparse worktree. Missing blobs are fetched from the
+    promisor remote in one batch by the checkout git runs internally.
+    """
+    paths = [p for p in dict.fromkeys(paths) if p]
+    if not paths:
+        return
+    subprocess.run(
+        ["git", "sparse-checkout", "add", "--stdin"],
+        cwd=temp_dir, input="\n".join(_sparse_pattern(p) for p in paths) + "\n",
+        text=True, check=True
+    )
+
+
+def list_tracked_files(temp_dir):
+    """All paths in the checked-out commit, including ones not materialized on disk."""
+    result = subprocess.run(["git", "ls-files"], cwd=temp_dir, capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()
+
+
+def get_tree_sha(temp_dir):
+    result = subprocess.run(["git", "rev-parse", "HEAD^{tree}"], cwd=temp_dir, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def read_blobs(temp_dir, paths):
+    """
+    Read HEAD:<path> for many paths with one `git cat-file --batch`, without
+    touching the working tree (works for sparse checkouts too).
+    Returns {path: bytes}; missing paths are skipped.
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    result = subprocess.run(
+        ["git", "cat-file", "--batch"], cwd=temp_dir, check=True, capture_output=True,
+        input="".join(f"HEAD:{path}\n" for path in paths).encode("utf-8")
+    )
+    out = result.stdout
+    blobs = {}
+    pos = 0
+    for path in paths:
+        header_end = out.index(b"\n", pos)
+        header = out[pos:header_end].split()
+        pos = header_end + 1
+        if len(header) < 3 or header[1] != b"blob":
+            continue
+        size = int(header[2])
+        blobs[path] = out[pos:pos + size]
+        pos += size + 1
+    return blobs
+
+
+def prefetch_blobs(temp_dir, blob_shas):
+    """
+    Fetch many blobs from the promisor remote in one request (partial clones),
+    instead of the one-round-trip-per-object lazy fetch `cat-file` would do.
+    """
+    blob_shas = [sha for sha in dict.fromkeys(blob_shas) if sha]
+    if not blob_shas:
+        return
+    subprocess.run(
+        ["git", "-c", "fetch.negotiationAlgorithm=noop", "fetch", "--quiet", "origin", "--no-tags",
+         "--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none", "--stdin"],
+        cwd=temp_dir, input="\n".join(blob_shas) + "\n", text=True, check=False
+    )
+
+
+def get_blob_shas(temp_dir):
+    """Map every tracked path to its blob SHA, read from the index (no blob fetch needed)."""
+    result = subprocess.run(["git", "ls-files", "-s", "-z"], cwd=temp_dir, capture_output=True, check=True)
+    blob_shas = {}
+    for entry in result.stdout.decode("utf-8", errors="replace").split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        blob_shas[path] = meta.split()[1]
+    return blob_shas
+
+
+def cleanup_checkout(repo_url, temp_dir):
+    """Remove a job worktree and unregister it from the mirror."""
+    mirror_dir = _mirror_path(repo_url)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    if os.path.isdir(mirror_dir):
+        with _mirror_lock(mirror_dir):
+            subprocess.run(["git", "worktree", "prune"], cwd=mirror_dir, check=False)
+
+
+def _diff_range(base_sha, since_sha=None):
+    # Full PR: merge-base of base..HEAD. Incremental: only what was pushed after since_sha.
+    if since_sha:
+        return [since_sha, "HEAD"]
+    return [f"{base_sha}...HEAD"]
+
+
+def is_ancestor(temp_dir, commit_sha):
+    """True if commit_sha is present and reachable from the checked-out HEAD (i.e. not force-pushed away)."""
+    result = subprocess.run(
+        ["git", "merge-base", "--is-ancestor", commit_sha, "HEAD"],
+        cwd=temp_dir, capture_output=True
+    )
+    return result.returncode == 0
+
+
+def get_changed_files(temp_dir, base_sha, since_sha=None):
+    diff_cmd = ["git", "diff", "--name-only", *_diff_range(base_sha, since_sha)]
     result = subprocess.run(diff_cmd, cwd=temp_dir, capture_output=True, text=True)
     return result.stdout.splitlines()
 
-def get_actual_diff(temp_dir, base_branch, head_branch, file_path):
-    cmd = ["git", "diff", f"origin/{base_branch}...origin/{head_branch}", "--", file_path]
-    result = subprocess.run(cmd, cwd=temp_dir, capture_output=True, text=True)
-    return result.stdout
+def get_pr_diff(temp_dir, base_sha, since_sha=None) -> PRDiff:
+    """
+    Run one `git diff` for the whole PR and split the streamed patch into
+    per-file hunks, instead of forking git once per changed file.
+    """
+    cmd = [
+        "git", "diff", "--no-color", "--no-ext-diff",
+        *_diff_range(base_sha, since_sha),
+    ]
+    proc = subprocess.Popen(cmd, cwd=temp_dir, stdout=subprocess.PIPE)
+    try:
+        lines = (raw.decode("utf-8", errors="replace").rstrip("\n") for raw in proc.stdout)
+        pr_diff = parse_unified_diff(lines)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return pr_diff
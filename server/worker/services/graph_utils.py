@@ -1,85 +1,129 @@
+import os
+import re
+from array import array
+from collections import defaultdict
 import networkx as nx
-import uuid
-
-
-LANG_RULES = {
-    "python": {
-        "func": [
-            "function_definition",
-            "async_function_definition",
-            "lambda"
-        ],
-        "class": ["class_definition"],
-        "call": ["call"],
-        "import": ["import_statement", "import_from_statement"],
-    },
-    "javascript": {
-        "func": [
-            "function_declaration",
-            "method_definition",
-            "arrow_function",
-            "function_expression"  # anonymous functions
-        ],
-        "class": ["class_declaration"],
-        "call": [
-            "call_expression",
-            "new_expression",
-            "import_expression"
-        ],
-        "import": ["import_declaration"],
-    },
-    "typescript": {
-        "func": [
-            "function_declaration",
-            "method_definition",
-            "arrow_function",
-            "function_expression"
-        ],
-        "class": ["class_declaration"],
-        "call": [
-            "call_expression",
-            "new_expression",
-            "import_expression"
-        ],
-        "import": ["import_declaration"],
-    },
-    "rust": {
-        "func": [
-            "function_item",     
-            "impl_item",          # methods inside impl blocks
-            "associated_function" # functions inside traits/impl
-        ],
-        "class": [
-            "struct_item",
-            "enum_item",
-            "trait_item"
-        ],
-        "call": [
-            "call_expression",
-            "method_call_expression",
-            "macro_call"         # Rust macros
-        ],
-        "import": ["use_declaration"],
-    },
-}
+from .parser_utils import extract_file_facts
 
+# How parsed ASTs are kept by the worker:
+#   "off"       not kept at all (default: nothing downstream reads the AST)
+#   "compact"   CompactCST per file (parallel int arrays)
+#   "networkx"  one networkx node/edge per AST node, merged into the combined graph
+# Building either form walks every node in Python, roughly doubling per-file
+# parse cost, so both are opt-in.
+AST_GRAPH = os.getenv("AST_GRAPH", "off").lower()
 
 
+class CompactCST:
+    """
+    Concrete syntax tree stored as parallel arrays in pre-order: node i has a
+    type id, a parent index (-1 for the root) and its start/end points.
+    Type names live once in a string table. Picklable and a few dozen bytes
+    per node, where the networkx form costs a dict per node and per edge.
+    """
+
+    def __init__(self, tree):
+        self.types = []
+        type_ids = {}
+        self.type_ids = array("H")
+        self.parents = array("i")
+        self.start_rows = array("I")
+        self.start_cols = array("I")
+        self.end_rows = array("I")
+        self.end_cols = array("I")
+        self._child_offsets = None
+
+        # TreeCursor walk: no recursion and no per-node child lists.
+        cursor = tree.walk()
+        stack = []
+        while True:
+            node = cursor.node
+            type_id = type_ids.get(node.type)
+            if type_id is None:
+                type_id = type_ids[node.type] = len(self.types)
+                self.types.append(node.type)
+            self.type_ids.append(type_id)
+            self.parents.append(stack[-1] if stack else -1)
+            self.start_rows.append(node.start_point[0])
+            self.start_cols.append(node.start_point[1])
+            self.end_rows.append(node.end_point[0])
+            self.end_cols.append(node.end_point[1])
+
+            if cursor.goto_first_child():
+                stack.append(len(self.parents) - 1)
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return
+                stack.pop()
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_child_offsets"] = None
+        return state
+
+    def node_type(self, i):
+        return self.types[self.type_ids[i]]
+
+    def span(self, i):
+        return (self.start_rows[i], self.start_cols[i]), (self.end_rows[i], self.end_cols[i])
+
+    def label(self, i):
+        """Same `type@(r, c)-(r, c)` label the networkx AST graph uses."""
+        start, end = self.span(i)
+        return f"{self.node_type(i)}@{start}-{end}"
+
+    def children(self, i):
+        """Child indices of node i, in source order."""
+        if self._child_offsets is None:
+            # Pre-order puts a node's children after it in order, so counting
+            # per parent gives CSR-style offsets into a flat child list.
+            counts = array("I", bytes(4 * (len(self) + 1)))
+            for parent in self.parents:
+                if parent >= 0:
+                    counts[parent + 1] += 1
+            for j in range(1, len(counts)):
+                counts[j] += counts[j - 1]
+            fill = array("I", counts)
+            flat = array("I", bytes(4 * max(len(self) - 1, 0)))
+            for child, parent in enumerate(self.parents):
+                if parent >= 0:
+                    flat[fill[parent]] = child
+                    fill[parent] += 1
+            self._child_offsets = (counts, flat)
+        counts, flat = self._child_offsets
+        return list(flat[counts[i]:counts[i + 1]])
+
+    def find(self, node_type):
+        """Indices of all nodes of the given type."""
+        type_id = self.types.index(node_type) if node_type in self.types else None
+        if type_id is None:
+            return []
+        return [i for i, t in enumerate(self.type_ids) if t == type_id]
+
+    def nodes(self):
+        return [self.label(i) for i in range(len(self))]
+
+    def edges(self):
+        return [(self.label(parent), self.label(child))
+                for child, parent in enumerate(self.parents) if parent >= 0]
+
+
+def ast_graph_parts(tree):
+    """Node labels and parent->child edges of the AST, as plain (picklable) lists."""
+    cst = CompactCST(tree)
+    return cst.nodes(), cst.edges()
+
 
 def build_graph_from_ast(tree):
     
     graph = nx.DiGraph()
-    
-    def walk(node, parent=None):
-        
-        label = f"{node.type}@{node.start_point}-{node.end_point}"
-        graph.add_node(label)
-        if parent:
-            graph.add_edge(parent, label)
-        for child in node.children:
-            walk(child, label)
-    
-    walk(tree.root_node)
+    nodes, edges = ast_graph_parts(tree)
+    graph.add_nodes_from(nodes)
+    graph.add_edges_from(edges)
     
     return graph
 
@@ -89,83 +133,124 @@ def build_semantic_graph(tree, source_code, lang, file_path):
     Build a semantic code graph from a Tree-sitter AST.
 
     Nodes: file-level imports, functions, classes/structs/enums, call targets.
-    Edges: 'contains', 'calls', 'imports', 'uses_import'.
+    Edges: 'contains', 'calls', 'imports'.
     """
+    return extract_file_facts(tree, source_code, lang, file_path).semantic_graph()
 
-    graph = nx.DiGraph()
-    lang_rules = LANG_RULES.get(lang, {})
-
-    def node_text(node):
-        try:
-            return source_code[node.start_byte:node.end_byte].decode("utf-8")
-        except Exception:
-            return ""
-
-    def add_def(name, kind, node):
-        # Use uuid to ensure anonymous functions/classes/macro nodes are unique
-        if name.startswith("anon_"):
-            name = f"{name}_{uuid.uuid4().hex[:6]}"
-        label = f"{file_path}::{kind}::{name}"
-        graph.add_node(label, type=kind, name=name, span=(node.start_point, node.end_point))
-        return label
-
-    def walk(node, current_def=None):
-        node_type = node.type
-
-        # --- function definitions ---
-        if node_type in lang_rules.get("func", []):
-            name_node = node.child_by_field_name("name") or (node.children[0] if node.children else None)
-            name = node_text(name_node).strip() if name_node else f"anon_func@{node.start_point}"
-            def_label = add_def(name, "function", node)
-            if current_def:
-                graph.add_edge(current_def, def_label, type="contains")
-            current_def = def_label
-
-        # --- class / struct / enum / trait definitions ---
-        if node_type in lang_rules.get("class", []):
-            name_node = node.child_by_field_name("name") or (node.children[0] if node.children else None)
-            name = node_text(name_node).strip() if name_node else f"anon_class@{node.start_point}"
-            def_label = add_def(name, "class", node)
-            if current_def:
-                graph.add_edge(current_def, def_label, type="contains")
-            current_def = def_label
-
-        # --- decorators (Python) ---q
-        if lang == "python" and node_type == "decorator":
-            dec_text = node_text(node).strip()
-            dec_label = f"{file_path}::decorator::{dec_text}"
-            graph.add_node(dec_label, type="decorator", code=dec_text)
-            if current_def:
-                graph.add_edge(current_def, dec_label, type="has_decorator")
-            else:
-                file_anchor = f"{file_path}::file"
-                graph.add_node(file_anchor, type="file")
-                graph.add_edge(file_anchor, dec_label, type="has_decorator")
-
-        # --- imports / use ---
-        if node_type in lang_rules.get("import", []):
-            import_text = node_text(node).strip()
-            imp_label = f"{file_path}::import::{import_text}"
-            graph.add_node(imp_label, type="import", code=import_text)
-            file_anchor = f"{file_path}::file"
-            graph.add_node(file_anchor, type="file")
-            graph.add_edge(file_anchor, imp_label, type="imports")
-
-        # --- call expressions ---
-        if node_type in lang_rules.get("call", []):
-            callee = node.child_by_field_name("function") or (node.children[0] if node.children else None)
-            if callee is not None:
-                called_name = node_text(callee).split("(")[0].strip()
-                # unique label for root-level calls too
-                called_label = f"{file_path}::call::{called_name}_{uuid.uuid4().hex[:6]}"
-                graph.add_node(called_label, type="call_target", name=called_name)
-                # attach to current_def if inside a function/class, else to file node
-                parent = current_def if current_def else f"{file_path}::file"
-                graph.add_node(parent, type="file")
-                graph.add_edge(parent, called_label, type="calls")
-
-        for child in node.children:
-            walk(child, current_def)
-
-    walk(tree.root_node)
-    return graph
+
+_CALLEE_SEPARATORS = re.compile(r"\.|->|::")
+
+
+_SELF_RECEIVERS = {"self", "cls", "this"}
+
+
+class SymbolTable:
+    """
+    Named definitions of all parsed files, by simple and qualified name, for
+    resolving call targets to definition nodes across files. Each definition
+    knows what encloses it (nothing, a class, or a function), so methods are
+    only reached through a receiver and nested functions only from their file.
+    """
+
+    def __init__(self, parsed_files):
+        self.by_name = defaultdict(list)
+        self.parent = {}
+        for path, facts in parsed_files.items():
+            types = {label: attrs.get("type") for label, attrs in facts.sem_nodes}
+            for src, dst, attrs in facts.sem_edges:
+                if attrs.get("type") == "contains":
+                    self.parent[dst] = (src, types.get(src))
+            for label, attrs in facts.sem_nodes:
+                if attrs.get("type") not in ("function", "class") or attrs.get("anonymous"):
+                    continue
+                scope = self.parent.get(label, (None, None))[1]
+                entry = (path, label, attrs["type"], scope)
+                self.by_name[attrs["name"]].append(entry)
+                if attrs["qualified_name"] != attrs["name"]:
+                    self.by_name[attrs["qualified_name"]].append(entry)
+
+    def _enclosing_class(self, label):
+        while label in self.parent:
+            label, kind = self.parent[label]
+            if kind == "class":
+                return label
+        return None
+
+    @staticmethod
+    def _pick(entries, scopes):
+        """The only entry in the first scope (set of paths, None = any) that has exactly one."""
+        for scope in scopes:
+            found = [label for path, label, _, _ in entries if scope is None or path in scope]
+            if len(found) == 1:
+                return found[0]
+        return None
+
+    def resolve(self, callee, caller_path, imported_paths=(), caller=None):
+        """
+        Definition label for a callee expression, or None if ambiguous/unknown.
+
+        A bare name is looked up in the caller's own file first, then among
+        the module-level definitions of files it imports, then accepted if
+        exactly one module-level definition has that name. `recv.method` is
+        only resolved when recv is self/cls/this (a method of the caller's
+        class, else of its file), a known class (`Class.method`), or a module
+        the caller imports; any other receiver (a local, an attribute, a
+        stdlib module) is unknown.
+        """
+        parts = [part for part in _CALLEE_SEPARATORS.split(callee) if part]
+        if not parts:
+            return None
+        imported_paths = set(imported_paths)
+        name = parts[-1]
+
+        if len(parts) == 1:
+            candidates = self.by_name.get(name, [])
+            owner = self._enclosing_class(caller) if caller else None
+            # Sibling methods count only inside their own class (implicit this).
+            local = [entry for entry in candidates if entry[0] == caller_path and (
+                entry[3] != "class" or self.parent[entry[1]][0] == owner)]
+            module_level = [entry for entry in candidates if entry[3] is None]
+            return self._pick(local, [None]) or self._pick(module_level, [imported_paths, None])
+
+        receiver = parts[-2]
+        methods = [entry for entry in self.by_name.get(name, []) if entry[3] == "class"]
+        if receiver in _SELF_RECEIVERS and len(parts) == 2:
+            owner = self._enclosing_class(caller) if caller else None
+            own = [entry for entry in methods if owner and self.parent.get(entry[1], (None,))[0] == owner]
+            return self._pick(own, [None]) or self._pick(methods, [{caller_path}])
+
+        classes = [entry for entry in self.by_name.get(receiver, []) if entry[2] == "class"]
+        if classes:
+            class_labels = {entry[1] for entry in classes}
+            members = [entry for entry in methods if self.parent.get(entry[1], (None,))[0] in class_labels]
+            return self._pick(members, [{caller_path}, imported_paths, None])
+
+        # module.function: a module-level definition in an imported file named
+        # after the receiver (file stem, or package directory for Go and friends).
+        modules = [
+            entry for entry in self.by_name.get(name, [])
+            if entry[3] is None and entry[0] in imported_paths and receiver in (
+                os.path.splitext(os.path.basename(entry[0]))[0], os.path.basename(os.path.dirname(entry[0]))
+            )
+        ]
+        return self._pick(modules, [None])
+
+
+def resolve_call_edges(parsed_files, import_edges=()):
+    """
+    Caller -> definition `calls` edges (weighted by call sites) for every call
+    the symbol table can resolve across the parsed files.
+    """
+    table = SymbolTable(parsed_files)
+    imported = defaultdict(set)
+    for importer, target in import_edges:
+        imported[importer].add(target)
+
+    weights = defaultdict(int)
+    for path, facts in parsed_files.items():
+        for caller, callee, count in facts.calls:
+            target = table.resolve(callee, path, imported[path], caller=caller)
+            if target and target != caller:
+                weights[(caller, target)] += count
+    return [(caller, target, {"type": "calls", "weight": weight})
+            for (caller, target), weight in weights.items()]
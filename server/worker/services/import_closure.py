@@ -0,0 +1,87 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+
+from .parser_utils import LANGUAGE_MAP
+
+IMPORT_MAX_DEPTH = int(os.getenv("IMPORT_MAX_DEPTH", "2"))
+IMPORT_MAX_FILES = int(os.getenv("IMPORT_MAX_FILES", "200"))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(4 * 1024 ** 2)))
+
+
+@dataclass
+class ImportBudget:
+    """Bounds for how far import expansion may go beyond the changed files."""
+    max_depth: int = IMPORT_MAX_DEPTH
+    max_files: int = IMPORT_MAX_FILES
+    max_bytes: int = IMPORT_MAX_BYTES
+
+
+def expand_import_closure(seed_files, parsed_files, repo_index, parse_batch, temp_dir,
+                          budget=None, materialize=None):
+    """
+    Breadth-first expansion over resolved imports, starting from seed_files.
+
+    Each level resolves the imports of the previous level and admits new files
+    closest-first (most importers first within a level) until the depth, file
+    or byte budget runs out. Only files with a parser (LANGUAGE_MAP) are
+    admitted, so non-source imports never use up the budget. parse_batch(paths) must parse the admitted files
+    into parsed_files so the next level can read their imports; materialize
+    (sparse checkouts) is called with each level's candidates before sizing.
+
+    Returns (edges, distance): every resolved (importer, imported) pair seen,
+    and the hop distance of each admitted file (seed files are 0).
+    """
+    budget = budget or ImportBudget()
+    distance = {path: 0 for path in seed_files}
+    edges = []
+    seen_edges = set()
+    frontier = list(seed_files)
+    admitted_files = 0
+    admitted_bytes = 0
+
+    for depth in range(1, budget.max_depth + 1):
+        fan_in = Counter()
+        for current in frontier:
+            facts = parsed_files.get(current)
+            if facts is None:
+                continue
+            for imp in facts.imports:
+                resolved = repo_index.resolve(imp, current, facts.lang)
+                if not resolved or resolved == current:
+                    continue
+                if (current, resolved) not in seen_edges:
+                    seen_edges.add((current, resolved))
+                    edges.append((current, resolved))
+                # Files no parser reads (data, styles, assets) keep their edge
+                # but never take a slot from a source file.
+                if resolved not in distance and os.path.splitext(resolved)[1] in LANGUAGE_MAP:
+                    fan_in[resolved] += 1
+
+        ranked = sorted(fan_in, key=lambda path: (-fan_in[path], path))
+        candidates = ranked[:max(budget.max_files - admitted_files, 0)]
+        if not candidates:
+            if ranked:
+                print(f"[Worker] Import budget: skipped {len(ranked)} file(s) at depth {depth}")
+            break
+        if materialize:
+            materialize(candidates)
+
+        level = []
+        for path in candidates:
+            abs_path = os.path.join(temp_dir, path)
+            size = os.path.getsize(abs_path) if os.path.exists(abs_path) else 0
+            if admitted_bytes + size > budget.max_bytes:
+                continue
+            admitted_bytes += size
+            distance[path] = depth
+            level.append(path)
+
+        skipped = len(ranked) - len(level)
+        if skipped:
+            print(f"[Worker] Import budget: skipped {skipped} file(s) at depth {depth}")
+        admitted_files += len(level)
+        parse_batch(level)
+        frontier = level
+
+    return edges, distance
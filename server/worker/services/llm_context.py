@@ -1,9 +1,14 @@
-from .parser_utils import extract_functions_from_ast
-from .git_utils import get_actual_diff
+from .symbol_index import touched_symbols, read_source_lines
 
-def prepare_llm_context(parsed_files, changed_files, combined_graph, temp_dir, base_branch, head_branch, LANGUAGE_MAP):
+
+def prepare_llm_context(parsed_files, changed_files, combined_graph, pr_diff, reverse_index=None,
+                        max_dependents=10, context_mode="full", temp_dir=None):
     """
-    Build structured context for LLM consumption.
+    Build structured context for LLM consumption from the job's CodeGraph.
+    With a reverse_index, imported_by lists the nearest repo-wide dependents
+    (at most max_dependents) instead of only the files parsed for this PR.
+    In "touched" mode each file lists only the definitions its hunks touch
+    (with bodies read from temp_dir) plus signatures of their neighbours.
     """
     context = {
         "summary": {
@@ -17,29 +22,35 @@ def prepare_llm_context(parsed_files, changed_files, combined_graph, temp_dir, b
         if file not in parsed_files:
             continue
         
-        tree, source_code = parsed_files[file]
-        ext = file.split('.')[-1]
-        lang = LANGUAGE_MAP.get(f".{ext}")
-        
-        definitions = extract_functions_from_ast(tree, source_code, lang)
-        diff = get_actual_diff(temp_dir, base_branch, head_branch, file)
+        facts = parsed_files[file]
+        lang = facts.lang
+        definitions = facts.definitions
+        diff = pr_diff.patch(file)
 
-        imports = []
-        imported_by = []
-        for edge in combined_graph.edges(data=True):
-            if edge[2].get('type') == 'import':
-                if edge[0] == file:
-                    imports.append(edge[1])
-                if edge[1] == file:
-                    imported_by.append(edge[0])
-        
-        context["files"][file] = {
+        imports = combined_graph.successors(file, "import")
+        imported_by = combined_graph.predecessors(file, "import")
+        total_dependents = len(imported_by)
+        if reverse_index is not None:
+            imported_by = reverse_index.dependents(file, limit=max_dependents)
+            total_dependents = reverse_index.dependents_count(file)
+
+        file_context = {
             "language": lang,
             "diff": diff,
+            "hunks": pr_diff.hunk_ranges(file),
             "definitions": definitions,
             "imports": imports,
             "imported_by": imported_by,
+            "total_dependents": total_dependents,
             "total_definitions": len(definitions)
         }
+
+        lines = read_source_lines(temp_dir, file) if context_mode == "touched" and temp_dir else None
+        if lines is not None:
+            touched = touched_symbols(definitions, pr_diff.get(file), lines)
+            file_context["definitions"] = touched["touched_symbols"]
+            file_context["neighbour_signatures"] = touched["neighbour_signatures"]
+
+        context["files"][file] = file_context
     
     return context
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os
+import pickle
+import zlib
+import hashlib
+import tempfile
+
+from .parser_utils import EXTRACTOR_VERSION
+
+PARSE_CACHE_DIR = os.getenv(
+    "PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "codedaddy_parse_cache")
+)
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+PARSE_CACHE_REDIS = os.getenv("PARSE_CACHE_REDIS", "false").lower() == "true"
+PARSE_CACHE_REDIS_TTL = int(os.getenv("PARSE_CACHE_REDIS_TTL", str(7 * 24 * 3600)))
+
+
+class ParseCache:
+    """
+    Content-addressed cache of FileFacts keyed by (extractor version, path, blob SHA).
+    Local disk is the first tier (LRU by mtime, bounded by max_bytes);
+    Redis is an optional shared second tier.
+    """
+
+    def __init__(self, cache_dir=PARSE_CACHE_DIR, max_bytes=PARSE_CACHE_MAX_BYTES, redis=None,
+                 redis_ttl=PARSE_CACHE_REDIS_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, blob_sha, path):
+        # Node labels inside FileFacts embed the path, so it is part of the key.
+        return hashlib.sha1(f"{EXTRACTOR_VERSION}:{path}:{blob_sha}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".pkl.z")
+
+    def get(self, blob_sha, path):
+        if not blob_sha:
+            return None
+        key = self.key(blob_sha, path)
+        disk_path = self._disk_path(key)
+
+        payload = None
+        try:
+            with open(disk_path, "rb") as f:
+                payload = f.read()
+            os.utime(disk_path, None)
+        except OSError:
+            if self.redis is not None:
+                try:
+                    payload = self.redis.get(f"codedaddy:parse:{key}")
+                except Exception as e:
+                    print(f"[ParseCache] Redis read failed: {e}")
+                if payload:
+                    self._write_disk(disk_path, payload)
+
+        if not payload:
+            self.misses += 1
+            return None
+        try:
+            facts = pickle.loads(zlib.decompress(payload))
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return facts
+
+    def put(self, blob_sha, path, facts):
+        if not blob_sha:
+            return
+        key = self.key(blob_sha, path)
+        payload = zlib.compress(pickle.dumps(facts, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write_disk(self._disk_path(key), payload)
+        if self.redis is not None:
+            try:
+                self.redis.set(f"codedaddy:parse:{key}", payload, ex=self.redis_ttl)
+            except Exception as e:
+                print(f"[ParseCache] Redis write failed: {e}")
+
+    def _write_disk(self, disk_path, payload):
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(disk_path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, disk_path)
+        except OSError as e:
+            print(f"[ParseCache] Disk write failed: {e}")
+
+    def evict(self):
+        """Remove least-recently-used entries until the disk tier fits max_bytes."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        for _, size, file_path in sorted(entries):
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
@@ -0,0 +1,56 @@
+import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from .parser_utils import parse_file, parse_source, extract_file_facts
+from .graph_utils import CompactCST, AST_GRAPH
+
+# Size of the process pool used for tree-sitter parsing (0 = one per CPU).
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+# Below this many files the pool start-up cost outweighs the gain.
+PARALLEL_PARSE_MIN_FILES = int(os.getenv("PARALLEL_PARSE_MIN_FILES", "8"))
+
+
+def _parse_one(job, ast_mode=AST_GRAPH):
+    file_path, file_name, lang = job
+    tree, source_code = parse_file(file_path, lang)
+    facts = extract_file_facts(tree, source_code, lang, file_name)
+    # Trees are not picklable; only the compact array form travels back to the parent.
+    cst = CompactCST(tree) if ast_mode != "off" else None
+    return facts, cst
+
+
+def _facts_from_blob(job):
+    file_name, lang, raw = job
+    tree, source_code = parse_source(raw, lang, file_name)
+    return extract_file_facts(tree, source_code, lang, file_name)
+
+
+def _map_jobs(func, jobs, max_workers):
+    jobs = list(jobs)
+    if max_workers <= 1 or len(jobs) < PARALLEL_PARSE_MIN_FILES:
+        for job in jobs:
+            yield func(job)
+        return
+
+    workers = min(max_workers, len(jobs))
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(func, jobs, chunksize=chunksize)
+
+
+def parse_files(jobs, max_workers=PARSE_WORKERS, ast_mode=AST_GRAPH):
+    """
+    Parse (file_path, file_name, lang) jobs, fanning out over a process pool
+    for large batches. Yields (facts, cst) in job order; cst is a CompactCST,
+    or None when ast_mode is "off".
+    """
+    yield from _map_jobs(partial(_parse_one, ast_mode=ast_mode), jobs, max_workers)
+
+
+def parse_blobs(jobs, max_workers=PARSE_WORKERS):
+    """
+    Extract FileFacts from (file_name, lang, raw_bytes) jobs read straight from
+    git, so files need not be checked out. Yields facts in job order.
+    """
+    yield from _map_jobs(_facts_from_blob, jobs, max_workers)
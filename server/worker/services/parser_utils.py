@@ -1,5 +1,9 @@
-import os
-from tree_sitter_languages import get_parser
+import re
+import networkx as nx
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple
+from tree_sitter_languages import get_parser, get_language
 
 LANGUAGE_MAP = {
     ".py": "python",
@@ -24,13 +28,21 @@ EXTENSION_GROUPS = {
 
 # ---------- Parse ----------
 def parse_file(file_path, lang_name):
-    parser = get_parser(lang_name)
-
     # Read raw bytes
     with open(file_path, "rb") as f:
         raw = f.read()
 
-    
+    tree, source_code = parse_source(raw, lang_name, file_path)
+    print("source code", source_code[:200])
+    print("parser", tree)
+
+    return tree, source_code
+
+
+def parse_source(raw, lang_name, file_path=""):
+    """Parse raw file bytes (e.g. a blob read from git) without touching disk."""
+    parser = get_parser(lang_name)
+
     try:
         source_code = raw.decode("utf-8")
     except UnicodeDecodeError:
@@ -39,210 +51,309 @@ def parse_file(file_path, lang_name):
 
     # MUST encode back to UTF-8 bytes for tree-sitter
     source_bytes = source_code.encode("utf-8")
+    return parser.parse(source_bytes), source_code
 
-    print("source code", source_code[:200])
-    tree = parser.parse(source_bytes)
-    print("parser", tree)
 
-    return tree, source_code
 
+# Bump whenever extract_file_facts output changes, so cached facts are not reused.
+EXTRACTOR_VERSION = 3
 
+# Tree-sitter queries per language. Capture names drive extraction:
+#   @def.function / @def.class  named definitions (context + semantic graph)
+#   @anon.function              lambdas/closures (semantic graph only)
+#   @import                     module path or string of an import
+#   @import.statement           whole import statement (semantic graph)
+#   @callee                     expression being called
+#   @decorator                  Python decorator
+# Captures starting with "_" only exist for predicates and are ignored.
+QUERY_SOURCES = {
+    "python": """
+        (function_definition) @def.function
+        (class_definition) @def.class
+        (lambda) @anon.function
+        (import_statement name: (dotted_name) @import)
+        (import_statement name: (aliased_import name: (dotted_name) @import))
+        (import_from_statement module_name: (_) @import)
+        (import_statement) @import.statement
+        (import_from_statement) @import.statement
+        (call function: (_) @callee)
+        (decorator) @decorator
+    """,
+    "javascript": """
+        (function_declaration) @def.function
+        (method_definition) @def.function
+        (class_declaration) @def.class
+        (arrow_function) @anon.function
+        (function) @anon.function
+        (import_statement source: (string) @import)
+        (export_statement source: (string) @import)
+        (call_expression
+            function: (identifier) @_fn (#eq? @_fn "require")
+            arguments: (arguments (string) @import))
+        (call_expression
+            function: (import)
+            arguments: (arguments (string) @import))
+        (import_statement) @import.statement
+        (call_expression function: (_) @callee)
+        (new_expression constructor: (_) @callee)
+    """,
+    "go": """
+        (function_declaration) @def.function
+        (method_declaration) @def.function
+        (type_declaration) @def.class
+        (func_literal) @anon.function
+        (import_spec path: (_) @import)
+        (import_declaration) @import.statement
+        (call_expression function: (_) @callee)
+    """,
+    "java": """
+        (method_declaration) @def.function
+        (constructor_declaration) @def.function
+        (class_declaration) @def.class
+        (interface_declaration) @def.class
+        (lambda_expression) @anon.function
+        (import_declaration [(scoped_identifier) (identifier)] @import)
+        (import_declaration) @import.statement
+        (method_invocation name: (_) @callee)
+        (object_creation_expression type: (_) @callee)
+    """,
+    "c": """
+        (function_definition) @def.function
+        (struct_specifier body: (_)) @def.class
+        (preproc_include path: (_) @import)
+        (preproc_include) @import.statement
+        (call_expression function: (_) @callee)
+    """,
+    "cpp": """
+        (function_definition) @def.function
+        (class_specifier body: (_)) @def.class
+        (struct_specifier body: (_)) @def.class
+        (lambda_expression) @anon.function
+        (preproc_include path: (_) @import)
+        (preproc_include) @import.statement
+        (call_expression function: (_) @callee)
+    """,
+    "rust": """
+        (function_item) @def.function
+        (struct_item) @def.class
+        (enum_item) @def.class
+        (trait_item) @def.class
+        (impl_item) @def.class
+        (closure_expression) @anon.function
+        (use_declaration argument: (_) @import)
+        (use_declaration) @import.statement
+        (call_expression function: (_) @callee)
+        (macro_invocation macro: (_) @callee)
+    """,
+}
+QUERY_SOURCES["typescript"] = QUERY_SOURCES["javascript"] + """
+        (abstract_class_declaration) @def.class
+        (interface_declaration) @def.class
+"""
 
-def extract_functions_from_ast(tree, source_code, lang_name):
-    definitions = []
-
-    def walk(node):
-        extracted = None
-
-        if lang_name == "python" and node.type in ("function_definition", "class_definition"):
-            name_node = node.child_by_field_name("name")
-            if name_node:
-                name = source_code[name_node.start_byte:name_node.end_byte]
-                params_node = node.child_by_field_name("parameters") if node.type=="function_definition" else None
-                params = source_code[params_node.start_byte:params_node.end_byte] if params_node else None
-                extracted = {
-                    "name": name,
-                    "type": node.type.replace("_definition",""),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                    "parameters": params,
-                    "children": []
-                }
-
-        # JS / TS
-        elif lang_name in ("javascript","typescript") and node.type in ("function_declaration","class_declaration","method_definition"):
-            name_node = node.child_by_field_name("name")
-            if name_node:
-                name = source_code[name_node.start_byte:name_node.end_byte]
-                params_node = node.child_by_field_name("parameters")
-                params = source_code[params_node.start_byte:params_node.end_byte] if params_node else None
-                extracted = {
-                    "name": name,
-                    "type": node.type.replace("_declaration","").replace("_definition",""),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                    "parameters": params,
-                    "children": []
-                }
-
-        # Java
-        elif lang_name == "java" and node.type in ("method_declaration","class_declaration"):
-            name_node = node.child_by_field_name("name")
-            if name_node:
-                name = source_code[name_node.start_byte:name_node.end_byte]
-                params_node = node.child_by_field_name("parameters") if node.type=="method_declaration" else None
-                params = source_code[params_node.start_byte:params_node.end_byte] if params_node else None
-                extracted = {
-                    "name": name,
-                    "type": node.type.replace("_declaration",""),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                    "parameters": params,
-                    "children": []
-                }
-
-        # Go
-        elif lang_name=="go" and node.type in ("function_declaration","method_declaration","type_declaration"):
-            name_node = node.child_by_field_name("name")
-            if name_node:
-                name = source_code[name_node.start_byte:name_node.end_byte]
-                params_node = node.child_by_field_name("parameters")
-                params = source_code[params_node.start_byte:params_node.end_byte] if params_node else None
-                extracted = {
-                    "name": name,
-                    "type": node.type.replace("_declaration",""),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                    "parameters": params,
-                    "children": []
-                }
-
-        # C / C++
-        elif lang_name in ("c","cpp") and node.type in ("function_definition","class_specifier","struct_specifier"):
-            name = None
-            for child in node.children:
-                if child.type=="function_declarator":
-                    for sub in child.children:
-                        if sub.type=="identifier":
-                            name = source_code[sub.start_byte:sub.end_byte]
-                            break
-                elif child.type in ("type_identifier","identifier"):
-                    name = source_code[child.start_byte:child.end_byte]
-            if name:
-                extracted = {
+
+_QUERY_REGISTRY = {}
+
+
+def get_query(lang_name):
+    """Compiled query for a language, built once per process. None if unsupported."""
+    if lang_name not in _QUERY_REGISTRY:
+        source = QUERY_SOURCES.get(lang_name)
+        _QUERY_REGISTRY[lang_name] = get_language(lang_name).query(source) if source else None
+    return _QUERY_REGISTRY[lang_name]
+
+
+@dataclass
+class FileFacts:
+    """
+    Everything the worker needs from one file, produced by a single parse and
+    a single walk. Plain lists only, so it can be pickled and cached.
+    """
+    path: str
+    lang: str
+    definitions: List[dict] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    sem_nodes: List[Tuple[str, dict]] = field(default_factory=list)
+    sem_edges: List[Tuple[str, str, dict]] = field(default_factory=list)
+    # (caller label, callee text, number of call sites) for cross-file resolution.
+    calls: List[Tuple[str, str, int]] = field(default_factory=list)
+
+    def semantic_graph(self):
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.sem_nodes)
+        graph.add_edges_from(self.sem_edges)
+        return graph
+
+
+def _definition_name_node(node):
+    name_node = node.child_by_field_name("name")
+    if name_node is not None:
+        return name_node
+    if node.type == "type_declaration":
+        for child in node.named_children:
+            if child.type == "type_spec":
+                return child.child_by_field_name("name")
+    # C/C++: the name sits at the bottom of the declarator chain
+    declarator = node.child_by_field_name("declarator")
+    while declarator is not None:
+        if declarator.type in ("identifier", "field_identifier", "qualified_identifier",
+                               "destructor_name", "operator_name"):
+            return declarator
+        declarator = declarator.child_by_field_name("declarator")
+    return None
+
+
+def _parameters_node(node):
+    params = node.child_by_field_name("parameters")
+    if params is not None:
+        return params
+    declarator = node.child_by_field_name("declarator")
+    while declarator is not None:
+        if declarator.type == "function_declarator":
+            return declarator.child_by_field_name("parameters")
+        declarator = declarator.child_by_field_name("declarator")
+    return None
+
+
+def _callee_name(callee_text):
+    """`a(x).b` -> `a.b`: drop argument lists so chained calls name their method."""
+    previous = None
+    while previous != callee_text:
+        previous = callee_text
+        callee_text = re.sub(r"\([^()]*\)", "", callee_text)
+    return "".join(callee_text.split("(")[0].split())
+
+
+def extract_file_facts(tree, source_code, lang_name, file_path):
+    """
+    Run the language's compiled query once over the tree and collect
+    definitions, imports and the semantic graph (functions, classes,
+    decorators, imports, call targets). Matching happens in tree-sitter;
+    Python only visits the captured nodes, so deep files cannot hit the
+    recursion limit.
+
+    Node IDs are deterministic: `path::kind::qualified.name`, with the start
+    position appended for anonymous definitions and repeated names. Call
+    sites collapse into one `calls` edge per (caller, callee) with a weight.
+    """
+    source = source_code.encode("utf-8") if isinstance(source_code, str) else source_code
+    facts = FileFacts(path=file_path, lang=lang_name)
+    query = get_query(lang_name)
+    if query is None:
+        return facts
+    file_anchor = f"{file_path}::file"
+    sem_nodes = {}
+
+    def text(node):
+        return source[node.start_byte:node.end_byte].decode("utf-8", errors="replace")
+
+    def add_sem_node(label, **attrs):
+        sem_nodes.setdefault(label, attrs)
+
+    def add_sem_edge(src, dst, edge_type):
+        facts.sem_edges.append((src, dst, {"type": edge_type}))
+
+    def anchor():
+        add_sem_node(file_anchor, type="file")
+        return file_anchor
+
+    def add_def(name, qualified_name, kind, node, anonymous):
+        label = f"{file_path}::{kind}::{qualified_name}"
+        if anonymous or label in sem_nodes:
+            label = f"{label}@{node.start_point[0] + 1}:{node.start_point[1]}"
+        add_sem_node(label, type=kind, name=name, qualified_name=qualified_name,
+                     anonymous=anonymous, span=(node.start_point, node.end_point))
+        return label
+
+    # Document order, outer nodes before the nodes they contain.
+    captures = sorted(
+        ((node, name) for node, name in query.captures(tree.root_node) if not name.startswith("_")),
+        key=lambda capture: (capture[0].start_byte, -capture[0].end_byte)
+    )
+
+    # Stack of (end_byte, label, qualified name) for the definitions enclosing the current capture.
+    scope = []
+    def_labels = {}
+    pending_decorators = []
+    call_counts = Counter()
+
+    def enclosing(node):
+        while scope and scope[-1][0] < node.end_byte:
+            scope.pop()
+        return scope[-1] if scope else None
+
+    for node, capture in captures:
+        outer = enclosing(node)
+        current_def = outer[1] if outer else None
+
+        if capture in ("def.function", "def.class", "anon.function"):
+            kind = "class" if capture == "def.class" else "function"
+            name_node = _definition_name_node(node)
+            anonymous = name_node is None or capture == "anon.function"
+            name = "<anonymous>" if anonymous else text(name_node).strip()
+            qualified_name = f"{outer[2]}.{name}" if outer else name
+
+            if not anonymous:
+                params_node = _parameters_node(node) if kind == "function" else None
+                facts.definitions.append({
                     "name": name,
-                    "type": node.type.replace("_definition","").replace("_specifier",""),
-                    "start_line": node.start_point[0]+1,
-                    "end_line": node.end_point[0]+1,
-                    "parameters": None,
+                    "type": node.type.replace("_definition", "").replace("_declaration", "").replace("_specifier", ""),
+                    "start_line": node.start_point[0] + 1,
+                    "end_line": node.end_point[0] + 1,
+                    "parameters": text(params_node) if params_node else None,
                     "children": []
-                }
+                })
 
-        if extracted:
-            definitions.append(extracted)
+            def_label = add_def(name, qualified_name, kind, node, anonymous)
+            def_labels[(node.start_byte, node.end_byte)] = def_label
+            if current_def:
+                add_sem_edge(current_def, def_label, "contains")
+            scope.append((node.end_byte, def_label, qualified_name))
 
-        for child in node.children:
-            walk(child)
+        elif capture == "import":
+            value = text(node)
+            facts.imports.append(value.strip('"').strip("'").strip("<>") if lang_name != "python" else value)
 
-    walk(tree.root_node)
-    return definitions
+        elif capture == "import.statement":
+            import_text = text(node).strip()
+            imp_label = f"{file_path}::import::{import_text}"
+            add_sem_node(imp_label, type="import", code=import_text)
+            add_sem_edge(anchor(), imp_label, "imports")
 
+        elif capture == "callee":
+            called_name = _callee_name(text(node))
+            # attach to current_def if inside a function/class, else to file node
+            call_counts[(current_def or anchor(), called_name)] += 1
 
+        elif capture == "decorator":
+            dec_text = text(node).strip()
+            dec_label = f"{file_path}::decorator::{dec_text}"
+            add_sem_node(dec_label, type="decorator", code=dec_text)
+            # Attach to the decorated definition, which follows the decorator.
+            decorated = node.parent.child_by_field_name("definition") if node.parent else None
+            owner = None
+            if decorated is not None:
+                owner = (decorated.start_byte, decorated.end_byte)
+            pending_decorators.append((owner, dec_label, current_def))
 
-def extract_imports_with_tree_sitter(file_path, lang_name):
-    imports = []
-    parser = get_parser(lang_name)
-    with open(file_path, "rb") as f:
-        source_code = f.read()
-    tree = parser.parse(source_code)
-    root = tree.root_node
-
-    def get_string_value(node):
-        text = source_code[node.start_byte:node.end_byte].decode("utf-8")
-        return text.strip('"').strip("'")
-
-    def walk(node):
-        if lang_name == "python":
-            if node.type == "import_from_statement":
-                for child in node.children:
-                    if child.type == "dotted_name":
-                        module = source_code[child.start_byte:child.end_byte].decode("utf-8")
-                        imports.append(module)
-                        break
-            elif node.type == "import_statement":
-                for child in node.children:
-                    if child.type == "dotted_name":
-                        module = source_code[child.start_byte:child.end_byte].decode("utf-8")
-                        imports.append(module)
-        elif lang_name in ("javascript", "typescript"):
-            if node.type == "import_statement":
-                for child in node.children:
-                    if child.type == "string":
-                        imports.append(get_string_value(child))
-            elif node.type == "call_expression":
-                func_node = node.child_by_field_name("function")
-                if func_node and source_code[func_node.start_byte:func_node.end_byte].decode("utf-8") in ["require", "import"]:
-                    args = node.child_by_field_name("arguments")
-                    if args:
-                        for child in args.children:
-                            if child.type == "string":
-                                imports.append(get_string_value(child))
-        elif lang_name == "go":
-            if node.type == "import_spec":
-                for child in node.children:
-                    if child.type == "interpreted_string_literal":
-                        imports.append(get_string_value(child))
-        elif lang_name == "java":
-            if node.type == "import_declaration":
-                text = source_code[node.start_byte:node.end_byte].decode("utf-8")
-                parts = text.replace("import", "").replace(";", "").strip().split()
-                if parts:
-                    imports.append(parts[0])
-        elif lang_name in ("c", "cpp"):
-            if node.type == "preproc_include":
-                for child in node.children:
-                    if child.type in ("string_literal", "system_lib_string"):
-                        path = source_code[child.start_byte:child.end_byte].decode("utf-8")
-                        imports.append(path.strip('"').strip("<>"))
-        for child in node.children:
-            walk(child)
-
-    walk(root)
-    return imports
-
-def resolve_import_path(import_str, current_file, temp_dir, lang):
-    current_dir = os.path.dirname(os.path.join(temp_dir, current_file))
-    extensions = EXTENSION_GROUPS.get(lang, [])
-    
-    if import_str.startswith('.'):
-        base_path = os.path.normpath(os.path.join(current_dir, import_str))
-    else:
-        base_path = os.path.normpath(os.path.join(current_dir, import_str))
-        if not any(os.path.exists(base_path + ext) for ext in extensions):
-            base_path = os.path.normpath(os.path.join(temp_dir, import_str))
-    
-    for ext in extensions:
-        candidate = base_path + ext
-        if os.path.exists(candidate):
-            return os.path.relpath(candidate, temp_dir)
-    
-    for ext in extensions:
-        candidate = os.path.join(base_path, f"index{ext}")
-        if os.path.exists(candidate):
-            return os.path.relpath(candidate, temp_dir)
-    
-    if lang == "python":
-        candidate = os.path.join(base_path, "__init__.py")
-        if os.path.exists(candidate):
-            return os.path.relpath(candidate, temp_dir)
-        pkg_path = os.path.join(temp_dir, import_str.replace(".", os.sep) + ".py")
-        if os.path.exists(pkg_path):
-            return os.path.relpath(pkg_path, temp_dir)
-    
-    if lang == "java":
-        java_path = os.path.join(temp_dir, import_str.replace(".", os.sep) + ".java")
-        if os.path.exists(java_path):
-            return os.path.relpath(java_path, temp_dir)
-    
-    return None
+    for owner, dec_label, current_def in pending_decorators:
+        add_sem_edge(def_labels.get(owner) or current_def or anchor(), dec_label, "has_decorator")
 
+    # One call_target node per callee name, one weighted edge per caller.
+    for (caller, called_name), count in call_counts.items():
+        called_label = f"{file_path}::call::{called_name}"
+        add_sem_node(called_label, type="call_target", name=called_name)
+        facts.sem_edges.append((caller, called_label, {"type": "calls", "weight": count}))
+        facts.calls.append((caller, called_name, count))
+
+    facts.sem_nodes = list(sem_nodes.items())
+    return facts
+
+
+def extract_functions_from_ast(tree, source_code, lang_name):
+    return extract_file_facts(tree, source_code, lang_name, "").definitions
+
+
+def extract_imports_with_tree_sitter(file_path, lang_name):
+    tree, source_code = parse_file(file_path, lang_name)
+    return extract_file_facts(tree, source_code, lang_name, file_path).imports
@@ -0,0 +1,293 @@
+import re
+import json
+import posixpath
+from collections import defaultdict
+
+from .parser_utils import EXTENSION_GROUPS
+from .git_utils import list_tracked_files, read_blobs, get_tree_sha
+
+# Bump when RepoIndex fields or resolution rules change (invalidates cached indexes).
+REPO_INDEX_VERSION = 1
+
+TSCONFIG_NAMES = ("tsconfig.json", "jsconfig.json")
+
+_JS_LANGS = ("javascript", "typescript")
+
+
+def _strip_jsonc(text):
+    """Drop // and /* */ comments and trailing commas so tsconfig files load as JSON."""
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if ch == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 2
+                continue
+            if ch == '"':
+                in_string = False
+            i += 1
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+            i += 1
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        else:
+            out.append(ch)
+            i += 1
+    return re.sub(r",\s*([}\]])", r"\1", "".join(out))
+
+
+def _parse_tsconfig(raw):
+    try:
+        options = json.loads(_strip_jsonc(raw)).get("compilerOptions") or {}
+    except (ValueError, AttributeError):
+        return None
+    base_url = options.get("baseUrl")
+    paths = options.get("paths") or {}
+    if base_url is None and not paths:
+        return None
+    return {"baseUrl": base_url, "paths": paths}
+
+
+def _parse_go_module(raw):
+    match = re.search(r"^\s*module\s+(\S+)", raw, re.MULTILINE)
+    return match.group(1).strip('"') if match else None
+
+
+class RepoIndex:
+    """
+    In-memory index of every tracked path at one commit. Import resolution is
+    done with set/dict lookups instead of stat calls against the checkout.
+    Picklable, so it can be cached per commit.
+    """
+
+    def __init__(self, paths, config_files=None):
+        self.files = set(paths)
+        self.dirs = set()
+        self.by_basename = defaultdict(list)
+        self.go_packages = defaultdict(list)
+        for path in sorted(self.files):
+            directory = posixpath.dirname(path)
+            self.by_basename[posixpath.basename(path)].append(path)
+            if path.endswith(".go") and not path.endswith("_test.go"):
+                self.go_packages[directory].append(path)
+            while directory and directory not in self.dirs:
+                self.dirs.add(directory)
+                directory = posixpath.dirname(directory)
+
+        self.python_modules = self._index_python_modules()
+
+        # tsconfig/jsconfig per directory, go.mod module path per directory.
+        self.tsconfigs = {}
+        self.go_modules = {}
+        for path, raw in (config_files or {}).items():
+            directory = posixpath.dirname(path)
+            name = posixpath.basename(path)
+            if name in TSCONFIG_NAMES and directory not in self.tsconfigs:
+                config = _parse_tsconfig(raw)
+                if config:
+                    self.tsconfigs[directory] = config
+            elif name == "go.mod":
+                module = _parse_go_module(raw)
+                if module:
+                    self.go_modules[directory] = module
+
+    @staticmethod
+    def config_paths(paths):
+        """Tracked files whose contents the index needs (tsconfig/jsconfig, go.mod)."""
+        return [p for p in paths if posixpath.basename(p) in TSCONFIG_NAMES + ("go.mod",)]
+
+    # ---------- Python ----------
+    def _index_python_modules(self):
+        """
+        Dotted module name -> path, for every import root. A directory is a root
+        if it is the repo root or contains a top-level package (a directory with
+        __init__.py whose parent has none), e.g. `src/` in a src-layout project.
+        """
+        roots = {""}
+        for path in self.files:
+            if posixpath.basename(path) == "__init__.py":
+                package = posixpath.dirname(path)
+                parent = posixpath.dirname(package)
+                if posixpath.join(parent, "__init__.py") not in self.files:
+                    roots.add(parent)
+
+        entries = []
+        for path in self.files:
+            if not path.endswith(".py"):
+                continue
+            directory = posixpath.dirname(path)
+            while True:
+                if directory in roots:
+                    prefix = directory + "/" if directory else ""
+                    module = path[len(prefix):-3].replace("/", ".")
+                    if module.endswith(".__init__"):
+                        module = module[:-len(".__init__")]
+                    entries.append((len(directory), module, path))
+                if not directory:
+                    break
+                directory = posixpath.dirname(directory)
+
+        # Outer roots take precedence when two roots expose the same module name.
+        modules = {}
+        for _, module, path in sorted(entries):
+            modules.setdefault(module, path)
+        return modules
+
+    def _python_file(self, base):
+        for candidate in (base + ".py", posixpath.join(base, "__init__.py")):
+            if candidate in self.files:
+                return candidate
+        return None
+
+    def _resolve_python(self, import_str, current_dir):
+        if import_str.startswith("."):
+            level = len(import_str) - len(import_str.lstrip("."))
+            base = current_dir
+            for _ in range(level - 1):
+                base = posixpath.dirname(base)
+            rest = import_str[level:]
+            if rest:
+                base = posixpath.join(base, rest.replace(".", "/"))
+            return self._python_file(base) if base else None
+
+        # Sibling module first (script directory on sys.path), then import roots.
+        sibling = self._python_file(posixpath.join(current_dir, import_str.replace(".", "/")))
+        return sibling or self.python_modules.get(import_str)
+
+    # ---------- JavaScript / TypeScript ----------
+    def _js_extensions(self, lang):
+        other = "javascript" if lang == "typescript" else "typescript"
+        return EXTENSION_GROUPS[lang] + EXTENSION_GROUPS[other]
+
+    def _resolve_js_path(self, base, lang):
+        base = posixpath.normpath(base)
+        if base in self.files:
+            return base
+        extensions = self._js_extensions(lang)
+        for ext in extensions:
+            if base + ext in self.files:
+                return base + ext
+        if base in self.dirs:
+            for ext in extensions:
+                candidate = posixpath.join(base, f"index{ext}")
+                if candidate in self.files:
+                    return candidate
+        return None
+
+    def _nearest_tsconfig(self, current_dir):
+        directory = current_dir
+        while True:
+            if directory in self.tsconfigs:
+                return directory, self.tsconfigs[directory]
+            if not directory:
+                return None, None
+            directory = posixpath.dirname(directory)
+
+    def _resolve_js(self, import_str, current_dir, lang):
+        if import_str.startswith("."):
+            return self._resolve_js_path(posixpath.join(current_dir, import_str), lang)
+
+        config_dir, config = self._nearest_tsconfig(current_dir)
+        if config:
+            base_dir = posixpath.normpath(posixpath.join(config_dir, config.get("baseUrl") or "."))
+            for pattern, targets in config["paths"].items():
+                prefix, star, suffix = pattern.partition("*")
+                if star:
+                    if not (import_str.startswith(prefix) and import_str.endswith(suffix)):
+                        continue
+                    matched = import_str[len(prefix):len(import_str) - len(suffix)]
+                elif import_str != pattern:
+                    continue
+                else:
+                    matched = ""
+                for target in targets:
+                    resolved = self._resolve_js_path(
+                        posixpath.join(base_dir, target.replace("*", matched)), lang
+                    )
+                    if resolved:
+                        return resolved
+            if config.get("baseUrl") is not None:
+                resolved = self._resolve_js_path(posixpath.join(base_dir, import_str), lang)
+                if resolved:
+                    return resolved
+
+        return (
+            self._resolve_js_path(posixpath.join(current_dir, import_str), lang)
+            or self._resolve_js_path(import_str, lang)
+        )
+
+    # ---------- Go ----------
+    def _resolve_go(self, import_str):
+        # Longest module prefix wins (nested modules).
+        for directory, module in sorted(self.go_modules.items(), key=lambda item: -len(item[1])):
+            if import_str == module or import_str.startswith(module + "/"):
+                package_dir = posixpath.normpath(posixpath.join(directory, import_str[len(module):].lstrip("/")))
+                package_dir = "" if package_dir == "." else package_dir
+                files = self.go_packages.get(package_dir)
+                # A Go import names a package (directory); report its first file.
+                return files[0] if files else None
+        return None
+
+    # ---------- Java / C / C++ ----------
+    def _resolve_by_suffix(self, relative_path):
+        if relative_path in self.files:
+            return relative_path
+        for path in self.by_basename.get(posixpath.basename(relative_path), []):
+            if path.endswith("/" + relative_path):
+                return path
+        return None
+
+    def resolve(self, import_str, current_file, lang):
+        """Resolve an import string from current_file to a repo-relative path, or None."""
+        if not import_str:
+            return None
+        current_dir = posixpath.dirname(current_file)
+
+        if lang == "python":
+            return self._resolve_python(import_str, current_dir)
+        if lang in _JS_LANGS:
+            return self._resolve_js(import_str, current_dir, lang)
+        if lang == "go":
+            return self._resolve_go(import_str)
+        if lang == "java":
+            return self._resolve_by_suffix(import_str.replace(".", "/") + ".java")
+        if lang in ("c", "cpp"):
+            local = posixpath.normpath(posixpath.join(current_dir, import_str))
+            if local in self.files:
+                return local
+            return self._resolve_by_suffix(posixpath.normpath(import_str))
+        return None
+
+
+def build_repo_index(temp_dir, cache=None):
+    """
+    Index the checked-out commit from `git ls-files` (plus tsconfig/go.mod
+    contents). With a cache, the index is stored under the commit's tree SHA
+    and reused by later jobs on the same tree.
+    """
+    tree_sha = get_tree_sha(temp_dir)
+    cache_path = f"__repo_index_v{REPO_INDEX_VERSION}__"
+    if cache is not None:
+        index = cache.get(tree_sha, cache_path)
+        if index is not None:
+            return index
+
+    paths = list_tracked_files(temp_dir)
+    config_files = {
+        path: raw.decode("utf-8", errors="replace")
+        for path, raw in read_blobs(temp_dir, RepoIndex.config_paths(paths)).items()
+    }
+    index = RepoIndex(paths, config_files)
+    if cache is not None:
+        cache.put(tree_sha, cache_path, index)
+    return index
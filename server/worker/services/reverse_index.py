@@ -0,0 +1,144 @@
+import os
+import posixpath
+from array import array
+from collections import defaultdict
+
+from .parser_utils import LANGUAGE_MAP
+from .parse_pool import parse_blobs
+from .repo_index import REPO_INDEX_VERSION
+from .git_utils import read_blobs, prefetch_blobs, PARTIAL_CLONE
+
+# Bump when the stored layout changes (invalidates cached reverse indexes).
+REVERSE_INDEX_VERSION = 1
+# Opt-in: a cold build parses every source file in the repository.
+REVERSE_INDEX_ENABLED = os.getenv("REVERSE_INDEX", "false").lower() == "true"
+# Dependents listed per changed file in the LLM context.
+REVERSE_INDEX_MAX_DEPENDENTS = int(os.getenv("REVERSE_INDEX_MAX_DEPENDENTS", "10"))
+# Blobs read from git (and parsed) per batch while updating the index.
+REVERSE_INDEX_BATCH = int(os.getenv("REVERSE_INDEX_BATCH", "500"))
+
+
+def _shared_depth(a, b):
+    """Number of leading directories two paths have in common."""
+    depth = 0
+    for x, y in zip(posixpath.dirname(a).split("/"), posixpath.dirname(b).split("/")):
+        if x != y or not x:
+            break
+        depth += 1
+    return depth
+
+
+class ReverseImportIndex:
+    """
+    Importers of every source file in a repository at one commit.
+
+    Paths are interned to integer ids. Per file it keeps the blob SHA and raw
+    import strings the entry was built from, so the next commit only re-parses
+    blobs that changed; per imported file it keeps an array of importer ids,
+    nearest directories first, so dependents() is a single dict lookup.
+    """
+
+    def __init__(self, tree_sha, blob_shas, raw_imports, repo_index):
+        importers = defaultdict(set)
+        for path, imports in raw_imports.items():
+            lang = LANGUAGE_MAP.get(posixpath.splitext(path)[1])
+            for imp in imports:
+                resolved = repo_index.resolve(imp, path, lang)
+                if resolved and resolved != path:
+                    importers[resolved].add(path)
+
+        self.tree_sha = tree_sha
+        self.paths = sorted(set(raw_imports) | set(importers))
+        self.ids = {path: i for i, path in enumerate(self.paths)}
+        self.blobs = {self.ids[path]: blob_shas.get(path) for path in raw_imports}
+        self.raw_imports = {self.ids[path]: tuple(imports) for path, imports in raw_imports.items()}
+        self.importers = {
+            self.ids[target]: array("I", (self.ids[path] for path in sorted(
+                sources, key=lambda path: (-_shared_depth(path, target), path)
+            )))
+            for target, sources in importers.items()
+        }
+
+    def __getstate__(self):
+        # ids is derived from paths; rebuilt on load to keep the stored form small.
+        state = self.__dict__.copy()
+        del state["ids"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ids = {path: i for i, path in enumerate(self.paths)}
+
+    def imports_of(self, path, blob_sha):
+        """Cached import strings for path if its blob is unchanged, else None."""
+        path_id = self.ids.get(path)
+        if path_id is None or self.blobs.get(path_id) != blob_sha:
+            return None
+        return self.raw_imports.get(path_id)
+
+    def dependents_count(self, path):
+        path_id = self.ids.get(path)
+        return len(self.importers.get(path_id, ())) if path_id is not None else 0
+
+    def dependents(self, path, limit=None):
+        """Files importing path, nearest first; at most limit of them."""
+        path_id = self.ids.get(path)
+        if path_id is None:
+            return []
+        ids = self.importers.get(path_id, ())
+        if limit is not None:
+            ids = ids[:limit]
+        return [self.paths[i] for i in ids]
+
+
+def build_reverse_index(temp_dir, repo_key, tree_sha, blob_shas, repo_index, cache=None, known_facts=None):
+    """
+    Reverse import index for the checked-out commit. The last index built for
+    repo_key is loaded from the cache and only files whose blob changed since
+    are parsed (straight from git, nothing is checked out); import strings are
+    then re-resolved against repo_index, which is a dictionary lookup per import.
+    known_facts (path -> FileFacts parsed for this job) are reused as is.
+    Returns None for a cold build on a partial clone, which would fetch every
+    blob of the repository.
+    """
+    slot = f"__reverse_index_v{REVERSE_INDEX_VERSION}_{REPO_INDEX_VERSION}__"
+    previous = cache.get(repo_key, slot) if cache is not None else None
+    if previous is not None and previous.tree_sha == tree_sha:
+        return previous
+
+    if previous is None and PARTIAL_CLONE:
+        print("[Worker] Reverse import index: no cached index, skipping the full build on a partial clone")
+        return None
+
+    known_facts = known_facts or {}
+    raw_imports = {}
+    pending = []
+    for path, blob_sha in blob_shas.items():
+        lang = LANGUAGE_MAP.get(posixpath.splitext(path)[1])
+        if not lang:
+            continue
+        if path in known_facts:
+            raw_imports[path] = known_facts[path].imports
+            continue
+        imports = previous.imports_of(path, blob_sha) if previous is not None else None
+        if imports is not None:
+            raw_imports[path] = imports
+            continue
+        pending.append((path, lang))
+
+    print(f"[Worker] Reverse import index: {len(pending)} file(s) to parse, "
+          f"{len(raw_imports)} reused" + ("" if previous is not None else " (full build)"))
+
+    for start in range(0, len(pending), REVERSE_INDEX_BATCH):
+        batch = pending[start:start + REVERSE_INDEX_BATCH]
+        if PARTIAL_CLONE:
+            prefetch_blobs(temp_dir, [blob_shas[path] for path, _ in batch])
+        blobs = read_blobs(temp_dir, [path for path, _ in batch])
+        jobs = [(path, lang, blobs[path]) for path, lang in batch if path in blobs]
+        for facts in parse_blobs(jobs):
+            raw_imports[facts.path] = facts.imports
+
+    index = ReverseImportIndex(tree_sha, blob_shas, raw_imports, repo_index)
+    if cache is not None:
+        cache.put(repo_key, slot, index)
+    return index
@@ -0,0 +1,124 @@
+import os
+from bisect import bisect_right
+from itertools import accumulate
+
+# "full": whole definitions list and full changed files.
+# "touched": only definitions overlapping a diff hunk, plus neighbour signatures.
+CONTEXT_MODE = os.getenv("CONTEXT_MODE", "full").lower()
+
+
+class SymbolIndex:
+    """
+    Interval index over one file's definition spans (1-based, inclusive,
+    head-side lines as produced by extract_file_facts). Definitions are kept
+    in document order with a running maximum of end lines, so an overlap
+    query is a bisect plus a backwards scan that stops as soon as no earlier
+    span can reach the queried range.
+    """
+
+    def __init__(self, definitions):
+        self.definitions = sorted(definitions, key=lambda d: (d["start_line"], -d["end_line"]))
+        self.starts = [d["start_line"] for d in self.definitions]
+        self.max_end = list(accumulate((d["end_line"] for d in self.definitions), max))
+
+        # Nesting: parent index per definition and children per parent (None = file level).
+        self.parent = []
+        self.children = {None: []}
+        stack = []
+        for i, definition in enumerate(self.definitions):
+            while stack and self.definitions[stack[-1]]["end_line"] < definition["start_line"]:
+                stack.pop()
+            parent = stack[-1] if stack else None
+            self.parent.append(parent)
+            self.children.setdefault(parent, []).append(i)
+            self.children[i] = []
+            stack.append(i)
+
+    def overlapping(self, start, end):
+        """Indices of definitions whose span overlaps [start, end], in document order."""
+        found = []
+        i = bisect_right(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] >= start:
+            if self.definitions[i]["end_line"] >= start:
+                found.append(i)
+            i -= 1
+        return found[::-1]
+
+    def innermost(self, start, end):
+        """Overlapping definitions that contain no other overlapping definition."""
+        hits = self.overlapping(start, end)
+        nested_parents = {self.parent[i] for i in hits}
+        return [i for i in hits if i not in nested_parents]
+
+    def touched(self, hunks):
+        """Innermost definitions containing a changed line of any hunk, in document order."""
+        touched = set()
+        for hunk in hunks:
+            for start, end in hunk.changed_ranges():
+                touched.update(self.innermost(start, end))
+        return sorted(touched)
+
+    def neighbours(self, index):
+        """Enclosing definition and the previous/next definition at the same level."""
+        siblings = self.children[self.parent[index]]
+        position = siblings.index(index)
+        found = [self.parent[index]] if self.parent[index] is not None else []
+        if position > 0:
+            found.append(siblings[position - 1])
+        if position + 1 < len(siblings):
+            found.append(siblings[position + 1])
+        return found
+
+
+def read_source_lines(temp_dir, path):
+    """Head-side lines of a checked-out file, or None if it cannot be read."""
+    try:
+        with open(os.path.join(temp_dir, path), "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if b"\x00" in raw:
+        return None
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1", errors="ignore")
+    return text.splitlines()
+
+
+def _signature(definition, lines):
+    line = lines[definition["start_line"] - 1] if definition["start_line"] <= len(lines) else ""
+    return {
+        "name": definition["name"],
+        "type": definition["type"],
+        "start_line": definition["start_line"],
+        "end_line": definition["end_line"],
+        "signature": line.strip(),
+    }
+
+
+def touched_symbols(definitions, file_diff, lines):
+    """
+    Definitions overlapping the file's hunks, with their source bodies, and
+    signatures of their neighbours (enclosing definition and adjacent siblings).
+    Without touched definitions the neighbours are the file's top-level outline.
+    """
+    index = SymbolIndex(definitions)
+    touched = index.touched(file_diff.hunks if file_diff else [])
+
+    if touched:
+        neighbour_ids = sorted({n for i in touched for n in index.neighbours(i)} - set(touched))
+    else:
+        neighbour_ids = index.children[None]
+
+    symbols = []
+    for i in touched:
+        definition = index.definitions[i]
+        symbols.append({
+            **definition,
+            "body": "\n".join(lines[definition["start_line"] - 1:definition["end_line"]]),
+        })
+    return {
+        "touched_symbols": symbols,
+        "neighbour_signatures": [_signature(index.definitions[i], lines) for i in neighbour_ids],
+    }
@@ -1,97 +1,195 @@
 import os
 
-from .parser_utils import  extract_imports_with_tree_sitter, resolve_import_path, LANGUAGE_MAP
-
-
-
-
-def write_pr_txt(pr_data, parsed_files, changed_files, temp_dir, output_dir="results", file_name=None):
+from server.utils.context_budget import CONTEXT_TEXT_TOKEN_BUDGET, TextBudget
+from .symbol_index import touched_symbols, read_source_lines
+
+# Content that costs budget without telling the reviewer anything: only a
+# one-line note is written for these.
+LOCKFILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "npm-shrinkwrap.json", "poetry.lock", "Pipfile.lock",
+    "uv.lock", "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock", "mix.lock", "pubspec.lock",
+}
+VENDORED_DIRS = {"vendor", "vendors", "node_modules", "third_party", "bower_components", "site-packages"}
+MINIFIED_SUFFIXES = (".min.js", ".min.css", ".min.mjs", ".bundle.js", ".js.map", ".css.map")
+# Average line length above which text is treated as minified / generated.
+MINIFIED_LINE_LENGTH = 400
+
+
+def low_value_reason(path, text=None):
+    """Why a file's content is elided ("lockfile", "vendored", "minified"), or None."""
+    name = os.path.basename(path)
+    if name in LOCKFILES:
+        return "lockfile"
+    if VENDORED_DIRS.intersection(path.split("/")[:-1]):
+        return "vendored"
+    if name.endswith(MINIFIED_SUFFIXES):
+        return "minified"
+    if text and len(text) / (text.count("\n") + 1) > MINIFIED_LINE_LENGTH:
+        return "minified"
+    return None
+
+
+def definitions_text(facts, text):
+    """One line per definition (line number + first line): the outline of an imported file."""
+    if facts is None or not facts.definitions:
+        return None
+    lines = text.splitlines()
+    out = []
+    for definition in sorted(facts.definitions, key=lambda d: d["start_line"]):
+        if definition["start_line"] <= len(lines):
+            out.append(f"{definition['start_line']}: {lines[definition['start_line'] - 1].strip()}\n")
+    return "".join(out) or None
+
+
+def elide_diff(path, diff_text):
+    """The patch, or a one-line note when the file is low-value (lockfile, vendored, minified)."""
+    reason = low_value_reason(path, diff_text)
+    if not reason:
+        return diff_text
+    line_count = diff_text.count("\n")
+    return f"[Elided {reason} diff: {line_count} lines]\n"
+
+
+def iter_pr_diffs(changed_files, pr_diff, budget=None):
+    """(file, patch) for each changed file, low-value patches elided, until the budget runs out."""
+    budget = budget or TextBudget(0)
+    for file in changed_files:
+        diff_text = pr_diff.patch(file)
+        if not diff_text:
+            continue
+        diff_text = budget.take(elide_diff(file, diff_text))
+        if diff_text is None:
+            return
+        yield file, diff_text
+
+
+def touched_symbols_text(file, facts, file_diff, temp_dir):
     """
-    Create a text file for the PR containing:
-    1. Git diff for changed files
-    2. Full source code of changed + imported files
+    Only the definitions touched by the file's hunks plus neighbour
+    signatures. Returns None when the full file should be used instead
+    (new files, unparsed files, unreadable sources).
+    """
+    if facts is None or file_diff is None or file_diff.status == "added":
+        return None
+    lines = read_source_lines(temp_dir, file)
+    if lines is None:
+        return None
+
+    touched = touched_symbols(facts.definitions, file_diff, lines)
+    out = []
+    for symbol in touched["touched_symbols"]:
+        out.append(f"# {symbol['type']} {symbol['name']} (lines {symbol['start_line']}-{symbol['end_line']})\n")
+        out.append(symbol["body"] + "\n")
+    if touched["neighbour_signatures"]:
+        out.append("# neighbours\n")
+        for neighbour in touched["neighbour_signatures"]:
+            out.append(f"{neighbour['start_line']}: {neighbour['signature']}\n")
+    return "".join(out)
+
+
+def iter_pr_sources(parsed_files, changed_files, pr_diff, import_distance, temp_dir, context_mode="full",
+                    budget=None):
+    """
+    Source section of the PR context, one file at a time: yields
+    (file, title, text) for changed files, then imported files by distance.
+    With a limited budget, changed files are cut down to their touched
+    symbols and imported files that no longer fit to their definitions.
     (safe for all encodings + binary protection)
     """
-    pr_number = pr_data["pr_number"]
-    txt_path = file_name or os.path.join(output_dir, f"pr_{pr_number}_context.txt")
 
     def is_binary(raw_bytes: bytes) -> bool:
         """Detect if a file is binary based on null bytes."""
         return b"\x00" in raw_bytes
 
-    with open(txt_path, "w", encoding="utf-8") as f:
-        # Header
-        f.write(f"PR #{pr_number} - Repo: {pr_data.get('repo_name', '')}\n")
-        f.write(f"Base branch: {pr_data['base_branch']}, Head branch: {pr_data['head_branch']}\n\n")
-
-        # -------------------------------
-        # SECTION 1: GIT DIFFS
-        # -------------------------------
-        f.write("=== GIT DIFFS ===\n")
-
-        import subprocess
-
-        for file in changed_files:
-            diff_path = os.path.join(temp_dir, file)
-            if os.path.exists(diff_path):
-                try:
-                    diff_text = subprocess.check_output(
-                        ["git", "diff", f"{pr_data['base_branch']}", f"{pr_data['head_branch']}", "--", file],
-                        cwd=temp_dir,
-                        text=True
-                    )
-                    f.write(f"\n--- {file} ---\n")
-                    f.write(diff_text)
-                except Exception as e:
-                    f.write(f"\n--- {file} ---\nError generating diff: {e}\n")
-
-        # -------------------------------
-        # SECTION 2: FULL FILES
-        # -------------------------------
-
-        f.write("\n=== FULL FILES (Changed + Imported) ===\n")
-
-        included_files = set(changed_files)
-
-        # Find imported files
-        for file in changed_files:
-            ext = os.path.splitext(file)[1]
-            lang = LANGUAGE_MAP.get(ext)
-
-            if lang:
-                imports = extract_imports_with_tree_sitter(os.path.join(temp_dir, file), lang)
-                for imp in imports:
-                    resolved_path = resolve_import_path(imp, file, temp_dir, lang)
-                    if resolved_path:
-                        included_files.add(resolved_path)
-
-        # Write file contents safely
-        for file in included_files:
-            abs_path = os.path.join(temp_dir, file)
-            if not os.path.exists(abs_path):
-                continue
-
-            f.write(f"\n--- {file} ---\n")
-
-            # Always open as raw bytes
-            try:
-                with open(abs_path, "rb") as code_file:
-                    raw = code_file.read()
-            except Exception as e:
-                f.write(f"[Error reading file: {e}]\n")
-                continue
-
-            # Detect binary files — skip
-            if is_binary(raw):
-                f.write("[Skipped binary file: contains non-text data]\n")
-                continue
-
-            # Safe decoding with fallback
-            try:
-                text = raw.decode("utf-8")
-            except UnicodeDecodeError:
-                text = raw.decode("latin-1", errors="ignore")
-
-            f.write(text)
-
-    return txt_path
+    budget = budget or TextBudget(0)
+    touched_view = context_mode == "touched" or budget.limited
+
+    # Changed files first, then imported files by distance from the change.
+    changed = set(changed_files)
+    included_files = list(dict.fromkeys(changed_files))
+    included_files += sorted(
+        (path for path in import_distance if path not in changed),
+        key=lambda path: (import_distance[path], path)
+    )
+
+    def read(file, abs_path):
+        """(title, text) for one file."""
+        file_diff = pr_diff.get(file)
+        if touched_view and file in changed:
+            text = touched_symbols_text(file, parsed_files.get(file), file_diff, temp_dir)
+            if text is not None:
+                return f"{file} (touched symbols)", text
+            if budget.limited and file_diff is not None and file_diff.status == "added":
+                return file, "[New file: full content is in the diff above]\n"
+
+        # Always open as raw bytes
+        try:
+            with open(abs_path, "rb") as code_file:
+                raw = code_file.read()
+        except Exception as e:
+            return file, f"[Error reading file: {e}]\n"
+
+        # Detect binary files — skip
+        if is_binary(raw):
+            return file, "[Skipped binary file: contains non-text data]\n"
+
+        # Safe decoding with fallback
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            text = raw.decode("latin-1", errors="ignore")
+
+        reason = low_value_reason(file, text)
+        if reason:
+            return file, f"[Elided {reason} file]\n"
+        if file not in changed and not budget.fits(text):
+            outline = definitions_text(parsed_files.get(file), text)
+            if outline:
+                return f"{file} (definitions)", outline
+        return file, text
+
+    for file in included_files:
+        abs_path = os.path.join(temp_dir, file)
+        if not os.path.exists(abs_path):
+            continue
+        title, text = read(file, abs_path)
+        text = budget.take(text)
+        if text is None:
+            return
+        yield file, title, text
+
+
+def write_pr_artifact(artifact, llm_context, parsed_files, changed_files, pr_diff, import_distance, temp_dir,
+                      context_mode="full", token_budget=CONTEXT_TEXT_TOKEN_BUDGET):
+    """
+    Stream the whole PR context into a ContextArtifactWriter: header, per-file
+    context, each diff once, the ranked selection, then the source section.
+    Diffs and sources share token_budget (0 = unlimited), filled in that
+    order; ContextArtifact.render_text() gives the plain-text view.
+    """
+    artifact.write("header", None, {
+        "pr_metadata": llm_context.get("pr_metadata", {}),
+        "summary": llm_context.get("summary", {}),
+    })
+    for file, file_context in llm_context.get("files", {}).items():
+        artifact.write("file", file, {key: value for key, value in file_context.items() if key != "diff"})
+    budget = TextBudget(token_budget)
+    written_diffs = {}
+    for file, diff_text in iter_pr_diffs(changed_files, pr_diff, budget):
+        artifact.write("diff", file, {"patch": diff_text})
+        written_diffs[file] = diff_text
+
+    selected = llm_context.get("selected_context")
+    if selected is not None:
+        # Diff snippets point at the diff records instead of repeating the patch
+        # (unless the budget elided or cut that record).
+        snippets = [
+            {key: value for key, value in snippet.items() if key != "code"}
+            if snippet["kind"] == "diff" and written_diffs.get(snippet["path"]) == snippet["code"] else snippet
+            for snippet in selected.get("snippets", [])
+        ]
+        artifact.write("selected_context", None, {**selected, "snippets": snippets})
+
+    for file, title, text in iter_pr_sources(parsed_files, changed_files, pr_diff, import_distance,
+                                             temp_dir, context_mode, budget):
+        artifact.write("source", file, {"title": title, "text": text})